@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+
+#Split files into content-defined chunks (FastCDC) and index the chunks,
+#to find the files which share most of their content without being exact
+#duplicates, such as virtual machine images or log archives.
+
+import array
+import collections
+import hashlib
+import itertools
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Default average size of a chunk; the minimum size is a quarter of it,
+# the maximum size eight times it
+CHUNK_AVERAGE_SIZE = 8 * 1024
+
+# Number of bytes read at once from a file being chunked
+CHUNK_READ_SIZE = 1024 * 1024
+
+# Default minimum ratio of shared bytes of the reported pairs of files
+MIN_SHARED_RATIO = 0.5
+
+# Default maximum number of files a chunk is counted in: chunks found in
+# more files, such as blocks of zeros or common headers, tell little about
+# which files are similar and would make the number of pairs quadratic
+MAX_CHUNK_FILES = 64
+
+# Number of bytes the rolling fingerprint depends on: each byte is shifted
+# out of its 64 bits after as many other bytes
+FINGERPRINT_WINDOW = 64
+
+_FINGERPRINT_MASK = (1 << 64) - 1
+
+# Random value of each byte added to the rolling fingerprint, fixed so that
+# a file is always split at the same boundaries
+GEAR = [int.from_bytes(hashlib.md5(bytes([byte])).digest()[:8], 'little')
+        for byte in range(256)]
+
+_GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint64) if numpy is not None else None
+
+
+def get_chunk_masks(average_size=CHUNK_AVERAGE_SIZE):
+    """
+    @param: average_size: the average size of a chunk, a power of two
+
+    @return: a tuple (mask_small, mask_large) of the bits of the
+        fingerprint tested before and after the average size: a cut point
+        is harder to find before and easier after it, so that the sizes of
+        the chunks are close to the average (normalized chunking)
+    """
+    bits = average_size.bit_length() - 1
+    # The high bits of the fingerprint depend on the most bytes
+    return (((1 << (bits + 2)) - 1) << (64 - bits - 2),
+            ((1 << (bits - 2)) - 1) << (64 - bits + 2))
+
+
+def get_chunk_sizes(average_size=CHUNK_AVERAGE_SIZE):
+    """
+    @param: average_size: the average size of a chunk, a power of two
+
+    @return: a tuple (min_size, max_size) of the bounds of the chunk size;
+        the first cut point is tested once the window of the fingerprint
+        is full, so that it only depends on the bytes of the chunk
+    """
+    return max(average_size // 4, FINGERPRINT_WINDOW), average_size * 8
+
+
+def get_chunk_length(data, offset, min_size, average_size, max_size,
+                     mask_small, mask_large):
+    """
+    Find the end of the chunk starting at an offset, byte by byte
+
+    @param:
+        -data: the bytes being chunked
+        -offset: the start of the chunk in data
+        -min_size, average_size, max_size: the bounds of the chunk size
+        -mask_small, mask_large: the masks returned by get_chunk_masks
+
+    @return: the length of the chunk
+    """
+    remaining_size = len(data) - offset
+    if remaining_size <= min_size:
+        return remaining_size
+
+    end = offset + min(remaining_size, max_size)
+    normal_end = offset + min(remaining_size, average_size)
+    gear = GEAR
+    fingerprint = 0
+
+    # Fill the window of the fingerprint before the first tested byte
+    start = offset + min_size
+    for byte in data[start - FINGERPRINT_WINDOW + 1:start]:
+        fingerprint = ((fingerprint << 1) + gear[byte]) & _FINGERPRINT_MASK
+
+    # Iterating over the bytes is faster than indexing them
+    for length, byte in enumerate(data[start:normal_end], start - offset + 1):
+        fingerprint = ((fingerprint << 1) + gear[byte]) & _FINGERPRINT_MASK
+        if not fingerprint & mask_small:
+            return length
+    start = max(start, normal_end)
+    for length, byte in enumerate(data[start:end], start - offset + 1):
+        fingerprint = ((fingerprint << 1) + gear[byte]) & _FINGERPRINT_MASK
+        if not fingerprint & mask_large:
+            return length
+    return end - offset
+
+
+def get_fingerprints(data):
+    """
+    Calculate the rolling fingerprint at every byte at once, with numpy:
+    the fingerprint of a window of 2w bytes is the one of its last w bytes
+    plus the one of its first w bytes shifted by w bits, so that
+    log2(FINGERPRINT_WINDOW) passes over the data are enough
+
+    @param: data: the bytes being chunked
+
+    @return: a numpy array of the fingerprint of the window ending at each
+        byte, the first ones of data having an incomplete window
+    """
+    fingerprints = _GEAR_ARRAY[numpy.frombuffer(data, dtype=numpy.uint8)]
+    shifted_fingerprints = numpy.empty_like(fingerprints)
+    window = 1
+    while window < FINGERPRINT_WINDOW:
+        # The sum wraps around 64 bits, as the fingerprint does
+        numpy.left_shift(fingerprints[:-window], numpy.uint64(window),
+                         out=shifted_fingerprints[window:])
+        numpy.add(fingerprints[window:], shifted_fingerprints[window:],
+                  out=fingerprints[window:])
+        window *= 2
+    return fingerprints
+
+
+def get_cut_points(data, mask_small, mask_large):
+    """
+    @param:
+        -data: the bytes being chunked
+        -mask_small, mask_large: the masks returned by get_chunk_masks
+
+    @return: a tuple (small_cut_points, large_cut_points) of sorted numpy
+        arrays of the offsets of the bytes whose fingerprint has none of
+        the bits of each mask
+    """
+    fingerprints = get_fingerprints(data)
+    return (numpy.flatnonzero(fingerprints & numpy.uint64(mask_small) == 0),
+            numpy.flatnonzero(fingerprints & numpy.uint64(mask_large) == 0))
+
+
+def get_chunk_length_from_cut_points(cut_points, data_size, offset, min_size,
+                                     average_size, max_size):
+    """
+    Find the end of the chunk starting at an offset, as get_chunk_length,
+    with a binary search of the cut points returned by get_cut_points
+
+    @return: the length of the chunk
+    """
+    remaining_size = data_size - offset
+    if remaining_size <= min_size:
+        return remaining_size
+
+    end = offset + min(remaining_size, max_size)
+    normal_end = offset + min(remaining_size, average_size)
+    start = offset + min_size
+    small_cut_points, large_cut_points = cut_points
+
+    i = small_cut_points.searchsorted(start)
+    if i < len(small_cut_points) and small_cut_points[i] < normal_end:
+        return int(small_cut_points[i]) - offset + 1
+    i = large_cut_points.searchsorted(max(start, normal_end))
+    if i < len(large_cut_points) and large_cut_points[i] < end:
+        return int(large_cut_points[i]) - offset + 1
+    return end - offset
+
+
+def get_file_chunks(file_path_name, average_size=CHUNK_AVERAGE_SIZE):
+    """
+    Split a file into content-defined chunks, the cut points of each block
+    being found at once if numpy is installed
+
+    @param:
+        -file_path_name: the absolute path of a file
+        -average_size: the average size of a chunk, a power of two
+
+    @return: a tuple (digests, lengths) of arrays of the 64-bit digest and
+        of the length of each chunk, in the order of the file
+    """
+    min_size, max_size = get_chunk_sizes(average_size)
+    mask_small, mask_large = get_chunk_masks(average_size)
+    digests = array.array('Q')
+    lengths = array.array('I')
+
+    with open(file_path_name, 'rb') as chunk_file:
+        data = b''
+        end_of_file = False
+        while data or not end_of_file:
+            # Keep at least a chunk of the maximum size ahead, but at the end
+            if not end_of_file and len(data) < max_size:
+                block = chunk_file.read(max(CHUNK_READ_SIZE, max_size))
+                end_of_file = not block
+                data += block
+                continue
+
+            if numpy is not None:
+                cut_points = get_cut_points(data, mask_small, mask_large)
+            view = memoryview(data)
+            offset = 0
+            while offset < len(data) and (end_of_file or len(data) - offset >= max_size):
+                if numpy is not None:
+                    length = get_chunk_length_from_cut_points(cut_points, len(data), offset,
+                                                              min_size, average_size, max_size)
+                else:
+                    length = get_chunk_length(data, offset, min_size, average_size, max_size,
+                                              mask_small, mask_large)
+                digests.append(int.from_bytes(hashlib.blake2b(
+                    view[offset:offset + length], digest_size=8).digest(), 'little'))
+                lengths.append(length)
+                offset += length
+            view.release()
+            data = data[offset:]
+
+    return digests, lengths
+
+
+class ChunkIndex:
+    """
+    The chunks of the indexed files in flat arrays, 16 bytes per chunk:
+    its digest, its length and the number of its file. The chunks are only
+    sorted by digest, vectorised if numpy is installed, when the files
+    which share them are looked for.
+    """
+    def __init__(self, max_chunk_files=MAX_CHUNK_FILES):
+        """
+        @param: max_chunk_files: the chunks found in more files than this
+            are not counted
+        """
+        self.max_chunk_files = max_chunk_files
+        self.file_path_names = []
+        self.file_sizes = array.array('Q')
+        self.digests = array.array('Q')       # chunk -> digest
+        self.lengths = array.array('I')       # chunk -> length
+        self.file_numbers = array.array('I')  # chunk -> file number
+
+    def __len__(self):
+        return len(self.digests)
+
+    def add_file(self, file_path_name, digests, lengths):
+        """
+        Index the chunks of a file
+
+        @param:
+            -file_path_name: the absolute path of a file
+            -digests, lengths: the chunks returned by get_file_chunks
+        """
+        file_number = len(self.file_path_names)
+        self.file_path_names.append(file_path_name)
+        self.file_sizes.append(sum(lengths))
+        self.digests.extend(digests)
+        self.lengths.extend(lengths)
+        self.file_numbers.extend(array.array('I', [file_number]) * len(digests))
+
+    def iter_shared_chunks(self):
+        """
+        @return: an iterator of tuples (length, file_numbers, counts) of the
+            chunks found in at least two files and at most max_chunk_files,
+            with the sorted numbers of these files and the number of times
+            the chunk is found in each of them
+        """
+        if numpy is None:
+            entries = sorted(zip(self.digests, self.file_numbers, self.lengths))
+            for _, chunk_entries in itertools.groupby(entries, key=operator.itemgetter(0)):
+                chunk_entries = list(chunk_entries)
+                file_counts = collections.Counter(file_number for _, file_number, _
+                                                  in chunk_entries)
+                if 1 < len(file_counts) <= self.max_chunk_files:
+                    yield (chunk_entries[0][2], list(file_counts),
+                           list(file_counts.values()))
+            return
+
+        if not len(self):
+            return
+        digests = numpy.frombuffer(self.digests, dtype=numpy.uint64)
+        file_numbers = numpy.frombuffer(self.file_numbers, dtype=numpy.uint32)
+        order = numpy.lexsort((file_numbers, digests))
+        digests = digests[order]
+        file_numbers = file_numbers[order]
+        lengths = numpy.frombuffer(self.lengths, dtype=numpy.uint32)[order]
+        del order
+
+        # One entry per chunk and file, with the number of its occurrences
+        new_digests = digests[1:] != digests[:-1]
+        entry_starts = numpy.flatnonzero(numpy.concatenate(
+            ([True], new_digests | (file_numbers[1:] != file_numbers[:-1]))))
+        counts = numpy.diff(numpy.append(entry_starts, len(digests)))
+        digests = digests[entry_starts]
+        file_numbers = file_numbers[entry_starts]
+        lengths = lengths[entry_starts]
+
+        # Then one run of entries per chunk, most of them of a single file
+        run_starts = numpy.flatnonzero(numpy.concatenate(([True], digests[1:] != digests[:-1])))
+        run_sizes = numpy.diff(numpy.append(run_starts, len(digests)))
+        shared_runs = (run_sizes > 1) & (run_sizes <= self.max_chunk_files)
+        for start, size in zip(run_starts[shared_runs].tolist(), run_sizes[shared_runs].tolist()):
+            yield (int(lengths[start]), file_numbers[start:start + size].tolist(),
+                   counts[start:start + size].tolist())
+
+    def get_shared_sizes(self):
+        """
+        @return: a dictionary of the number of bytes shared by each pair of
+            files, the key being a tuple of their file numbers; a chunk
+            repeated in both files is shared as many times as it is found
+            in the file which has the fewest of it
+        """
+        shared_sizes = {}
+        for length, file_numbers, counts in self.iter_shared_chunks():
+            for i, (file_number, count) in enumerate(zip(file_numbers, counts)):
+                for other_file_number, other_count in zip(file_numbers[i + 1:], counts[i + 1:]):
+                    pair = (file_number, other_file_number)
+                    shared_sizes[pair] = shared_sizes.get(pair, 0) \
+                        + length * min(count, other_count)
+        return shared_sizes
+
+    def get_similar_file_pairs(self, min_shared_ratio=MIN_SHARED_RATIO):
+        """
+        @param: min_shared_ratio: the minimum ratio of bytes shared by two
+            files, over the size of the largest one
+
+        @return: a list of dictionaries with the paths of two files, the
+            number of bytes they share and its ratio, the most similar
+            pairs first
+        """
+        similar_file_pairs = []
+        for (file_number, other_file_number), shared_size in self.get_shared_sizes().items():
+            ratio = shared_size / max(self.file_sizes[file_number],
+                                      self.file_sizes[other_file_number])
+            if ratio >= min_shared_ratio:
+                similar_file_pairs.append({
+                    'files': [self.file_path_names[file_number],
+                              self.file_path_names[other_file_number]],
+                    'shared_bytes': shared_size,
+                    'shared_ratio': round(ratio, 4),
+                })
+        similar_file_pairs.sort(key=lambda pair: (-pair['shared_ratio'], pair['files']))
+        return similar_file_pairs
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+#Reclaim the space used by duplicate files by replacing them with hard links,
+#or with reflinks (copy-on-write clones) where the file system supports them.
+
+import errno
+import filecmp
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows
+    fcntl = None
+
+# ioctl request cloning a whole file on Linux (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+ACTIONS = ('report', 'hardlink', 'reflink')
+
+
+class LinkReport:
+    """
+    Count the files replaced by links and the bytes saved
+    """
+    def __init__(self):
+        self.group_count = 0
+        self.linked_file_count = 0
+        self.skipped_file_count = 0
+        self.failed_file_count = 0
+        self.saved_bytes = 0
+
+    def __str__(self):
+        return (f'{self.linked_file_count} files linked in {self.group_count} groups, '
+                f'{self.saved_bytes} bytes saved ({self.skipped_file_count} already '
+                f'linked, {self.failed_file_count} failed)')
+
+
+def get_temporary_path(file_path_name):
+    """
+    @return: a path next to the given file, where its replacement is built
+        before being renamed over it
+    """
+    dir_path, file_name = os.path.split(file_path_name)
+    return os.path.join(dir_path, '.%s.%d.dedup' % (file_name, os.getpid()))
+
+
+def hardlink_file(source_file_path_name, file_path_name):
+    """
+    Replace a file with a hard link to another one, atomically
+
+    @param:
+        -source_file_path_name: the absolute path of the file to link to
+        -file_path_name: the absolute path of the file to replace
+    """
+    temporary_path = get_temporary_path(file_path_name)
+    os.link(source_file_path_name, temporary_path)
+    try:
+        os.replace(temporary_path, file_path_name)
+    except OSError:
+        os.unlink(temporary_path)
+        raise
+
+
+def reflink_file(source_file_path_name, file_path_name):
+    """
+    Replace a file with a copy-on-write clone of another one, atomically,
+    keeping the permissions and times of the replaced file
+
+    @param:
+        -source_file_path_name: the absolute path of the file to clone
+        -file_path_name: the absolute path of the file to replace
+
+    @raise OSError: if the file system does not support reflinks
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflinks are not supported on this platform')
+
+    temporary_path = get_temporary_path(file_path_name)
+    try:
+        with open(source_file_path_name, 'rb') as source_file, \
+                open(temporary_path, 'wb') as clone_file:
+            fcntl.ioctl(clone_file.fileno(), FICLONE, source_file.fileno())
+        shutil.copystat(file_path_name, temporary_path)
+        os.replace(temporary_path, file_path_name)
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+
+
+LINK_FUNCTIONS = {
+    'hardlink': hardlink_file,
+    'reflink': reflink_file,
+}
+
+
+def link_duplicate_group(file_path_names, action, report, dry_run=False, verify=True):
+    """
+    Replace all the files of a group of duplicates with links to the first one
+
+    @param:
+        -file_path_names: a group of duplicate files
+        -action: 'hardlink' or 'reflink'
+        -report: the ``LinkReport`` to update
+        -dry_run: only count the bytes which would be saved
+        -verify: compare each file byte by byte with the first one before
+            replacing it, in case the group was found by checksum only
+    """
+    link_file = LINK_FUNCTIONS[action]
+    source_file_path_name = file_path_names[0]
+    source_stat = os.stat(source_file_path_name)
+    report.group_count += 1
+
+    # Links of an inode replaced so far, as a dry run leaves them in place
+    replaced_link_counts = {}
+
+    for file_path in file_path_names[1:]:
+        try:
+            file_stat = os.stat(file_path)
+            # Already a hard link of the same inode, nothing to reclaim
+            if (file_stat.st_dev, file_stat.st_ino) == (source_stat.st_dev, source_stat.st_ino):
+                report.skipped_file_count += 1
+                continue
+            if action == 'hardlink' and file_stat.st_dev != source_stat.st_dev:
+                report.failed_file_count += 1
+                continue
+            if verify and not filecmp.cmp(source_file_path_name, file_path, shallow=False):
+                report.failed_file_count += 1
+                continue
+            if not dry_run:
+                link_file(source_file_path_name, file_path)
+        except OSError:
+            report.failed_file_count += 1
+            continue
+
+        report.linked_file_count += 1
+        # The data of a hard-linked inode is only freed with its last link
+        inode = (file_stat.st_dev, file_stat.st_ino)
+        replaced_link_counts[inode] = replaced_link_counts.get(inode, 0) + 1
+        remaining_link_count = file_stat.st_nlink - (replaced_link_counts[inode] - 1
+                                                     if dry_run else 0)
+        if remaining_link_count == 1:
+            report.saved_bytes += file_stat.st_size
+
+
+def link_duplicate_groups(groups, action, report, dry_run=False, verify=True):
+    """
+    Replace the duplicate files with links as the groups are found
+
+    @param:
+        -groups: an iterable of groups of duplicate files
+        -action: 'hardlink' or 'reflink'
+        -report: the ``LinkReport`` to update
+        -dry_run: only count the bytes which would be saved
+        -verify: compare the files byte by byte before replacing them
+
+    @return: an iterator of the groups, each one yielded once its files
+        have been linked
+    """
+    for group in groups:
+        link_duplicate_group(group, action, report, dry_run, verify)
+        yield group
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+#Indexes of the files of a tree by size and by checksum, updated file by
+#file as the tree changes, so that the duplicate files are known at any
+#time without scanning the whole tree again.
+
+import json
+import os
+import stat
+import time
+
+import inotify
+
+# Default number of seconds between two scans where inotify is not available
+WATCH_INTERVAL = 60.0
+
+
+class DuplicateIndex:
+    """
+    The files of a tree grouped by size, and the files sharing their size
+    grouped by checksum; a file is only hashed once another file of the
+    same size appears
+    """
+    def __init__(self, checksum_function, hash_name):
+        """
+        @param:
+            -checksum_function: a function returning the checksum of a file
+                from its absolute path
+            -hash_name: the name of the hash algorithm, a saved index of
+                another algorithm is not loaded
+        """
+        self.checksum_function = checksum_function
+        self.hash_name = hash_name
+        self.file_stats = {}      # file path name -> (size, mtime_ns)
+        self.checksums = {}       # file path name -> checksum
+        self.size_index = {}      # size -> set of file path names
+        self.checksum_index = {}  # (size, checksum) -> set of file path names
+
+    def add_file(self, file_path_name, file_stat):
+        """
+        Index a new or modified file, hashing it and the other files of the
+        same size which have not been hashed yet
+
+        @param:
+            -file_path_name: the absolute path of a file
+            -file_stat: the ``os.stat_result`` of the file
+        """
+        file_key = (file_stat.st_size, file_stat.st_mtime_ns)
+        if self.file_stats.get(file_path_name) == file_key:
+            return
+        self.remove_file(file_path_name)
+
+        # Empty files are not duplicates of each other
+        if not file_stat.st_size:
+            return
+
+        self.file_stats[file_path_name] = file_key
+        same_size_paths = self.size_index.setdefault(file_stat.st_size, set())
+        same_size_paths.add(file_path_name)
+        if len(same_size_paths) > 1:
+            for file_path in list(same_size_paths):
+                if file_path not in self.checksums:
+                    self._hash_file(file_path)
+
+    def _hash_file(self, file_path_name):
+        try:
+            checksum = self.checksum_function(file_path_name)
+        except OSError: # Removed meanwhile, its own event follows
+            return
+        self._index_checksum(file_path_name, checksum)
+
+    def _index_checksum(self, file_path_name, checksum):
+        self.checksums[file_path_name] = checksum
+        self.checksum_index.setdefault((self.file_stats[file_path_name][0], checksum),
+                                       set()).add(file_path_name)
+
+    def remove_file(self, file_path_name):
+        """
+        Remove a file from the indexes, if it is indexed
+
+        @param: file_path_name: the absolute path of a file
+        """
+        file_key = self.file_stats.pop(file_path_name, None)
+        if file_key is None:
+            return
+
+        size = file_key[0]
+        self.size_index[size].discard(file_path_name)
+        if not self.size_index[size]:
+            del self.size_index[size]
+
+        checksum = self.checksums.pop(file_path_name, None)
+        if checksum is not None:
+            self.checksum_index[size, checksum].discard(file_path_name)
+            if not self.checksum_index[size, checksum]:
+                del self.checksum_index[size, checksum]
+
+    def update_file(self, file_path_name, file_filter=None):
+        """
+        Index a file, or remove it from the indexes if it is not a regular
+        file anymore or if it is filtered out
+
+        @param:
+            -file_path_name: the absolute path of a file
+            -file_filter: a ``scan_filter.ScanFilter``, or None
+        """
+        try:
+            file_stat = os.stat(file_path_name, follow_symlinks=False)
+        except OSError:
+            file_stat = None
+
+        if file_stat and stat.S_ISREG(file_stat.st_mode) \
+                and (file_filter is None or file_filter.accept_file(file_path_name, file_stat)):
+            self.add_file(file_path_name, file_stat)
+        else:
+            self.remove_file(file_path_name)
+
+    def remove_tree(self, dir_path):
+        """
+        Remove all the files of a directory from the indexes
+
+        @param: dir_path: the absolute path of a directory
+        """
+        prefix = os.path.join(dir_path, '')
+        for file_path in [file_path for file_path in self.file_stats
+                          if file_path.startswith(prefix)]:
+            self.remove_file(file_path)
+
+    def update_tree(self, dir_path, file_stats):
+        """
+        Synchronize the indexes with a scan of a directory: the files not
+        found anymore are removed, the new or modified ones are indexed
+
+        @param:
+            -dir_path: the absolute path of the scanned directory
+            -file_stats: a dictionary of the stat results of its files, the
+                key is the absolute path of a file
+        """
+        prefix = os.path.join(dir_path, '')
+        for file_path in [file_path for file_path in self.file_stats
+                          if file_path.startswith(prefix) and file_path not in file_stats]:
+            self.remove_file(file_path)
+
+        for file_path, file_stat in file_stats.items():
+            self.add_file(file_path, file_stat)
+
+    def get_duplicate_groups(self):
+        """
+        @return: a list of the groups of duplicate files, sorted by path
+        """
+        return sorted(sorted(file_paths) for file_paths in self.checksum_index.values()
+                      if len(file_paths) > 1)
+
+    def save(self, file_path_name):
+        """
+        Write the indexes to a JSON file
+
+        @param: file_path_name: path and name of the file
+        """
+        temporary_path = file_path_name + '.tmp'
+        with open(temporary_path, 'w') as index_file:
+            json.dump({
+                'hash': self.hash_name,
+                'files': {file_path: [size, mtime_ns, self.checksums.get(file_path)]
+                          for file_path, (size, mtime_ns) in self.file_stats.items()},
+            }, index_file)
+        os.replace(temporary_path, file_path_name)
+
+    def load(self, file_path_name):
+        """
+        Read the indexes saved to a JSON file; they are then synchronized
+        with the tree by ``update_tree``, which only hashes the files
+        modified since
+
+        @param: file_path_name: path and name of the file
+
+        @return: True if the indexes have been loaded, False if they were
+            saved with another hash algorithm
+        """
+        with open(file_path_name) as index_file:
+            saved_index = json.load(index_file)
+        if saved_index['hash'] != self.hash_name:
+            return False
+
+        for file_path, (size, mtime_ns, checksum) in saved_index['files'].items():
+            self.file_stats[file_path] = (size, mtime_ns)
+            self.size_index.setdefault(size, set()).add(file_path)
+            if checksum is not None:
+                self._index_checksum(file_path, checksum)
+        return True
+
+
+def add_tree_watches(watcher, path, dir_paths, file_filter=None):
+    """
+    Watch a directory and all its sub-directories
+
+    @param:
+        -watcher: an ``inotify.Inotify``
+        -path: the absolute path of a directory
+        -dir_paths: the dictionary of the watched directories, by watch
+            descriptor, to update
+        -file_filter: a ``scan_filter.ScanFilter`` whose excluded
+            sub-directories are not watched, or None
+    """
+    for dir_path, dir_names, _ in os.walk(path):
+        if file_filter:
+            dir_names[:] = [dir_name for dir_name in dir_names
+                            if file_filter.accept_directory(os.path.join(dir_path, dir_name))]
+        try:
+            dir_paths[watcher.add_watch(dir_path)] = dir_path
+        except OSError: # Removed meanwhile, or not readable
+            pass
+
+
+def remove_tree_watches(watcher, path, dir_paths):
+    """
+    Stop watching a directory and all its sub-directories, e.g. once they
+    have been moved elsewhere
+    """
+    prefix = os.path.join(path, '')
+    for watch_descriptor, dir_path in list(dir_paths.items()):
+        if dir_path == path or dir_path.startswith(prefix):
+            watcher.remove_watch(watch_descriptor)
+            del dir_paths[watch_descriptor]
+
+
+def watch_tree(watcher, path, index, scan_file_stats, file_filter=None, on_scanned=None):
+    """
+    Update the indexes from the inotify events of a tree, until interrupted
+
+    @param:
+        -watcher: an ``inotify.Inotify``
+        -path: the absolute path of the root directory
+        -index: the ``DuplicateIndex`` to update
+        -scan_file_stats: a function returning the dictionary of the stat
+            results of the files of a directory, scanned recursively
+        -file_filter: a ``scan_filter.ScanFilter``, or None
+        -on_scanned: a function called with the index once it is in sync
+            with the tree
+    """
+    dir_paths = {}
+
+    # Watch before scanning, so that no change made during the scan is missed
+    add_tree_watches(watcher, path, dir_paths, file_filter)
+    index.update_tree(path, scan_file_stats(path))
+    if on_scanned:
+        on_scanned(index)
+
+    while True:
+        changed_file_paths = {}
+        for watch_descriptor, mask, cookie, name in watcher.read_events():
+            if mask & inotify.IN_Q_OVERFLOW:
+                # Events have been lost, scan the whole tree again
+                remove_tree_watches(watcher, path, dir_paths)
+                add_tree_watches(watcher, path, dir_paths, file_filter)
+                index.update_tree(path, scan_file_stats(path))
+                continue
+
+            if watch_descriptor not in dir_paths:
+                continue
+            if mask & inotify.IN_IGNORED:
+                del dir_paths[watch_descriptor]
+                continue
+            if not name:
+                continue
+
+            entry_path = os.path.join(dir_paths[watch_descriptor], name)
+            if not mask & inotify.IN_ISDIR:
+                # Several events of a same file are handled once
+                changed_file_paths[entry_path] = None
+            elif mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                if file_filter and not file_filter.accept_directory(entry_path):
+                    continue
+                add_tree_watches(watcher, entry_path, dir_paths, file_filter)
+                index.update_tree(entry_path, scan_file_stats(entry_path))
+            elif mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                remove_tree_watches(watcher, entry_path, dir_paths)
+                index.remove_tree(entry_path)
+
+        for file_path in changed_file_paths:
+            index.update_file(file_path, file_filter)
+
+
+def poll_tree(path, index, scan_file_stats, interval=WATCH_INTERVAL, on_scanned=None):
+    """
+    Update the indexes by scanning a tree periodically, until interrupted;
+    unchanged files are not hashed again
+
+    @param:
+        -path: the absolute path of the root directory
+        -index: the ``DuplicateIndex`` to update
+        -scan_file_stats: a function returning the dictionary of the stat
+            results of the files of a directory, scanned recursively
+        -interval: the number of seconds between two scans
+        -on_scanned: a function called with the index once it is in sync
+            with the tree, the first time
+    """
+    index.update_tree(path, scan_file_stats(path))
+    if on_scanned:
+        on_scanned(index)
+
+    while True:
+        time.sleep(interval)
+        index.update_tree(path, scan_file_stats(path))
+
+
+def watch_duplicate_files(path, index, scan_file_stats, interval=WATCH_INTERVAL,
+                          file_filter=None, on_scanned=None):
+    """
+    Keep the indexes of a tree up to date as its files are created,
+    modified or removed, with inotify where available and by scanning
+    the tree periodically elsewhere, until interrupted
+
+    @param: the arguments of poll_tree, and the ``scan_filter.ScanFilter``
+        of the files, or None
+    """
+    try:
+        watcher = inotify.Inotify()
+    except OSError:
+        poll_tree(path, index, scan_file_stats, interval, on_scanned)
+        return
+
+    with watcher:
+        watch_tree(watcher, path, index, scan_file_stats, file_filter, on_scanned)
@@ -4,12 +4,33 @@
 #a list of duplicate files identified by their absolute path and name.
 
 import argparse
+import array
+import concurrent.futures
+import contextlib
+import functools
+import itertools
 import os
 import sys
 import pprint
 import hashlib
 import json
+import mmap
+import signal
+import threading
 import time
+import zlib
+
+import chunking
+import deduplicate
+import duplicate_index
+import hash_cache
+import path_index
+import scan_filter
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 # WAYPOINT01: Write a Python Script Skeleton
 def parse_arguments():
@@ -24,10 +45,123 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description='Duplicate Files Finder')
 
     # Add positional and optional arguments
-    parser.add_argument('-p', '--path', metavar='PATH', required=True,
+    parser.add_argument('-p', '--path', metavar='PATH',
         help='The root directory to start scanning for duplicate files')
+    parser.add_argument('--compact-index', action='store_true',
+        help='Keep the scanned files in a compact index of arrays, group them '
+             'by size and checksum as ids, and only turn the files being read '
+             'into paths, to scan trees of hundreds of millions of files')
+    parser.add_argument('--include', metavar='GLOB', action='append', default=[],
+        help='Only collect the files matching this pattern, matched against '
+             'their name, or their absolute path if it contains a separator; '
+             'can be repeated')
+    parser.add_argument('--exclude', metavar='GLOB', action='append', default=[],
+        help='Skip the files and directories matching this pattern (e.g. '
+             'node_modules, .git, *.tmp); excluded directories are not '
+             'descended into; can be repeated')
+    parser.add_argument('--include-regex', metavar='REGEX', action='append', default=[],
+        help='Only collect the files whose absolute path matches this regular '
+             'expression; can be repeated')
+    parser.add_argument('--exclude-regex', metavar='REGEX', action='append', default=[],
+        help='Skip the files and directories whose absolute path matches this '
+             'regular expression; can be repeated')
+    parser.add_argument('--min-size', metavar='BYTES', type=int,
+        help='Skip the files smaller than this size')
+    parser.add_argument('--max-size', metavar='BYTES', type=int,
+        help='Skip the files larger than this size')
+    parser.add_argument('--one-file-system', action='store_true',
+        help='Do not descend into directories on other file systems, such as '
+             'mount points')
+    parser.add_argument('--exclude-fs', metavar='TYPE', action='append', default=[],
+        help='Do not descend into the mount points of this type of file '
+             'system (e.g. nfs, fuse.sshfs); can be repeated')
+    parser.add_argument('-m', '--method', choices=METHODS, default='compare',
+        help='The strategy used to find duplicate files (default: compare)')
+    parser.add_argument('--chunk-size', metavar='KIB', type=int,
+        default=chunking.CHUNK_AVERAGE_SIZE // 1024,
+        help='The average size in KiB, a power of two, of the content-defined '
+             'chunks of the chunks method (default: %(default)s)')
+    parser.add_argument('--min-shared-ratio', metavar='RATIO', type=float,
+        default=chunking.MIN_SHARED_RATIO,
+        help='The minimum ratio of bytes shared by the pairs of files reported '
+             'by the chunks method, over the size of the largest file '
+             '(default: %(default)s)')
+    parser.add_argument('--max-chunk-files', metavar='N', type=int,
+        default=chunking.MAX_CHUNK_FILES,
+        help='The chunks found in more files than this, such as blocks of '
+             'zeros, are not counted by the chunks method (default: %(default)s)')
+    parser.add_argument('--partial-size', metavar='KIB', type=int,
+        default=PARTIAL_SIZE // 1024,
+        help='The number of KiB read at the head and the tail of each file '
+             'by the partial checksum stage of the staged method, 0 to skip '
+             'this stage (default: %(default)s)')
+    parser.add_argument('--hash', choices=sorted(HASH_METHODS), default='md5',
+        help='The hash algorithm used to calculate checksums (default: md5)')
+    parser.add_argument('--final-stage', choices=FINAL_STAGES, default='checksum',
+        help='The last stage of the staged method run on the files that '
+             'survived the partial checksum stage (default: checksum)')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+        help='The number of workers hashing or comparing files in parallel '
+             '(default: %(default)s)')
+    parser.add_argument('--pool', choices=POOLS, default='thread',
+        help='The kind of worker pool used when --jobs is above 1, process '
+             'for CPU-bound hash algorithms (default: thread)')
+    parser.add_argument('--max-open-files', metavar='N', type=int,
+        help='The maximum number of files opened at once by the workers, '
+             'including the files of a size group compared together')
+    parser.add_argument('--mmap', action='store_true',
+        help='Map the files in memory to hash or compare them without copying '
+             'their content, files which cannot be mapped are read instead')
+    parser.add_argument('-o', '--output', choices=OUTPUT_FORMATS, default='json',
+        help='json: output all the groups once the scan is finished; ndjson: '
+             'output each group on its own line as soon as it is confirmed, '
+             'the statistics being written to stderr (default: json)')
+    parser.add_argument('-a', '--action', choices=deduplicate.ACTIONS, default='report',
+        help='report: only output the duplicate files; hardlink or reflink: '
+             'replace the duplicates of each group with links to its first '
+             'file and report the bytes saved (default: report)')
+    parser.add_argument('--dry-run', action='store_true',
+        help='With --action, report the bytes which would be saved without '
+             'linking any file')
+    parser.add_argument('--cache', metavar='FILE',
+        help='The SQLite database where checksums are kept between scans, '
+             'only new or modified files are hashed again')
+    parser.add_argument('--vacuum-cache', action='store_true',
+        help='Remove the stale checksums from the cache, shrink it and exit')
+    parser.add_argument('--cache-eviction-days', metavar='DAYS', type=int,
+        default=hash_cache.CACHE_EVICTION_DAYS,
+        help='The number of days after which an unused checksum is removed '
+             'from the cache (default: %(default)s)')
+    parser.add_argument('--watch', action='store_true',
+        help='Keep running after the scan and update the duplicate groups as '
+             'files are created, modified or removed (inotify on Linux, a '
+             'periodic scan elsewhere); send SIGUSR1 to output the current '
+             'groups, which are also output on exit')
+    parser.add_argument('--watch-interval', metavar='SECONDS', type=float,
+        default=duplicate_index.WATCH_INTERVAL,
+        help='With --watch, the number of seconds between two scans where '
+             'inotify is not available (default: %(default)s)')
+    parser.add_argument('--index', metavar='FILE',
+        help='With --watch, the JSON file the size and checksum indexes are '
+             'loaded from at start and saved to on exit')
 
-    return parser.parse_args()
+    arguments = parser.parse_args()
+    if arguments.vacuum_cache and not arguments.cache:
+        parser.error('--vacuum-cache requires --cache')
+    if not arguments.path and not arguments.vacuum_cache:
+        parser.error('the following arguments are required: -p/--path')
+    if arguments.chunk_size < 4 or arguments.chunk_size & (arguments.chunk_size - 1):
+        parser.error('--chunk-size must be a power of two of at least 4')
+    if arguments.max_chunk_files < 2:
+        parser.error('--max-chunk-files must be at least 2')
+    if arguments.method == 'chunks' and (arguments.action != 'report' or arguments.watch
+                                         or arguments.compact_index):
+        parser.error('the chunks method only reports the similar files, of all sizes')
+    if arguments.watch and arguments.action != 'report':
+        parser.error('--watch only reports the duplicate files')
+    if arguments.index and not arguments.watch:
+        parser.error('--index requires --watch')
+    return arguments
 
 def check_exist_pathname(path_name):
     """
@@ -46,99 +180,581 @@ def check_exist_pathname(path_name):
         return os.path.exists(path_name)
 
 # WAYPOINT02: Search for all the Files
-def scan_files(path):
+def scan_files(path, jobs=1, file_filter=None):
     """
     Search all the files from an absolute path
 
-    @param: path: an absolute path
+    @param:
+        -path: an absolute path
+        -jobs: the number of directories scanned in parallel
+        -file_filter: a ``scan_filter.ScanFilter``, or None
 
     @return: A flat list of files (scanned recursively) from the specified path
     """
+    return [entry.path for entry in scan_file_entries(path, jobs, file_filter)]
+
+def scan_directory(dir_path, file_filter=None):
+    """
+    List the regular files and the sub-directories of a directory, the
+    file type coming from the directory listing itself
+
+    @param:
+        -dir_path: the absolute path of a directory
+        -file_filter: a ``scan_filter.ScanFilter`` skipping the excluded
+            files and sub-directories, or None
+
+    @return: a tuple (file_entries, sub_dir_paths) where file_entries are
+        the ``os.DirEntry`` of the files (symlinks excluded), with their
+        stat result already cached
+    """
+    file_entries = []
+    sub_dir_paths = []
+
+    # Ignore unreadable directories as os.walk does
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    # Excluded directories are never descended into
+                    if file_filter is None or file_filter.accept_directory(entry.path):
+                        sub_dir_paths.append(entry.path)
+                # eleminate symlink list
+                elif entry.is_file(follow_symlinks=False):
+                    # The one stat of the file, cached by the entry
+                    file_stat = entry.stat(follow_symlinks=False)
+                    if file_filter is None or file_filter.accept_file(entry.path, file_stat):
+                        file_entries.append(entry)
+    except OSError:
+        pass
+
+    return file_entries, sub_dir_paths
+
+def scan_file_entries(path, jobs=1, file_filter=None):
+    """
+    Search all the files from an absolute path, sub-directories being
+    scanned in parallel by a pool of threads
+
+    @param:
+        -path: an absolute path
+        -jobs: the number of directories scanned in parallel
+        -file_filter: a ``scan_filter.ScanFilter``, or None
+
+    @return: A flat list of ``os.DirEntry`` of files, in the order os.walk
+        would have returned them
+    """
+    scanned_dirs = {}
+
+    if jobs <= 1:
+        pending_dir_paths = [path]
+        while pending_dir_paths:
+            dir_path = pending_dir_paths.pop()
+            scanned_dirs[dir_path] = scan_directory(dir_path, file_filter)
+            pending_dir_paths.extend(scanned_dirs[dir_path][1])
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = {executor.submit(scan_directory, path, file_filter): path}
+            while pending:
+                done, _ = concurrent.futures.wait(pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    dir_path = pending.pop(future)
+                    scanned_dirs[dir_path] = future.result()
+                    for sub_dir_path in scanned_dirs[dir_path][1]:
+                        pending[executor.submit(scan_directory, sub_dir_path,
+                                                file_filter)] = sub_dir_path
+
+    # Merge the directories top-down whatever the order they were scanned in
+    file_entries = []
+    dir_paths = [path]
+    while dir_paths:
+        dir_file_entries, sub_dir_paths = scanned_dirs[dir_paths.pop()]
+        file_entries.extend(dir_file_entries)
+        dir_paths.extend(reversed(sub_dir_paths))
+
+    return file_entries
+
+def scan_path_index(path, jobs=1, file_filter=None):
+    """
+    Search all the files from an absolute path into a compact index, level
+    by level, the directories of a level being scanned in parallel by a
+    pool of threads
+
+    @param:
+        -path: an absolute path
+        -jobs: the number of directories scanned in parallel
+        -file_filter: a ``scan_filter.ScanFilter``, or None
+
+    @return: a ``path_index.PathIndex`` of the files, in breadth-first order
+    """
+    index = path_index.PathIndex()
+    scan = functools.partial(scan_directory, file_filter=file_filter)
+    dir_level = [(path, index.add_directory(path))]
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    with executor or contextlib.nullcontext():
+        while dir_level:
+            scanned_dirs = (executor.map if executor else map)(
+                scan, [dir_path for dir_path, _ in dir_level])
+            next_dir_level = []
+            # Only the stat results of the current level are kept as objects
+            for (_, dir_id), (file_entries, sub_dir_paths) in zip(dir_level, scanned_dirs):
+                for entry in file_entries:
+                    index.add_file(dir_id, entry.name, entry.stat(follow_symlinks=False))
+                for sub_dir_path in sub_dir_paths:
+                    next_dir_level.append((sub_dir_path, index.add_directory(
+                        os.path.basename(sub_dir_path), dir_id)))
+            dir_level = next_dir_level
+
+    return index
+
+def get_file_stats(file_entries):
+    """
+    @param: file_entries: a list of ``os.DirEntry`` returned by scan_file_entries
+
+    @return: a dictionary of the stat results of the files, the key is the
+        absolute path of a file
+    """
+    return {entry.path: entry.stat(follow_symlinks=False) for entry in file_entries}
+
+# Worker pools
+POOLS = ('thread', 'process')
+
+def get_worker_count(jobs=1, max_open_files=None, files_per_task=1):
+    """
+    @param:
+        -jobs: the number of workers requested
+        -max_open_files: the maximum number of files opened at once
+        -files_per_task: the minimum number of files opened by each task
+
+    @return: the number of workers which stays below the open file limit
+    """
+    if max_open_files:
+        return max(1, min(jobs, max_open_files // files_per_task))
+    return max(1, jobs)
+
+def create_executor(jobs=1, pool='thread', max_open_files=None, files_per_task=1):
+    """
+    Create the pool of workers hashing or comparing files
+
+    @param:
+        -jobs: the number of workers
+        -pool: 'thread' or 'process'
+        -max_open_files: the maximum number of files opened at once, the
+            number of workers is reduced to stay below this limit
+        -files_per_task: the minimum number of files opened by each task
+
+    @return: a ``concurrent.futures.Executor``, or None if the work should
+        be done by the current thread
+    """
+    jobs = get_worker_count(jobs, max_open_files, files_per_task)
+    if jobs <= 1:
+        return None
+    if pool == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+def _call_with_statistics(function, file_path_name):
+    """
+    Call a function in a worker process and return the hash statistics it
+    produced, which would be lost otherwise
+    """
+    byte_count, seconds = HASH_STATISTICS.bytes, HASH_STATISTICS.seconds
+    result = function(file_path_name)
+    return (result, HASH_STATISTICS.bytes - byte_count,
+            HASH_STATISTICS.seconds - seconds)
+
+def map_files(function, file_path_names, executor=None):
+    """
+    Call a function on each file, in parallel if an executor is given
+
+    @param:
+        -function: a function taking the absolute path of a file
+        -file_path_names: A flat list of the absolute path and name of files
+        -executor: an executor returned by create_executor, or None
+
+    @return: an iterator of the results, in the same order as
+        file_path_names, each result being available as soon as it is
+        calculated
+    """
+    if executor is None:
+        return (function(file_path) for file_path in file_path_names)
 
-    # Create a list of Absolute Path
-    full_paths_list = []
+    if not isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        return executor.map(function, file_path_names)
 
-    for dir_path, file_name, filenames in os.walk(path):
-        for file_name in filenames:
-            full_path = os.path.join(dir_path, file_name)
-            # eleminate symlink list
-            if not os.path.islink(full_path):
-                full_paths_list.append(full_path)
-            
-    return full_paths_list
+    return _collect_statistics(executor.map(
+        functools.partial(_call_with_statistics, function),
+        file_path_names, chunksize=16))
 
-def group_by_condition(file_path_names, function):
+def _collect_statistics(results):
+    """
+    Add the hash statistics returned by the worker processes to the ones
+    of this process
+
+    @return: an iterator of the results without their statistics
+    """
+    for result, byte_count, seconds in results:
+        HASH_STATISTICS.add(byte_count, seconds)
+        yield result
+
+# Number of new results stored in the cache at once
+CACHE_BATCH_SIZE = 1000
+
+def map_files_with_cache(function, file_path_names, executor=None, cache=None,
+                         stage=None, file_stats=None):
+    """
+    Call a function on each file whose result is not found in the cache,
+    and store the new results in the cache by batches, as they come
+
+    @param:
+        -function: a function taking the absolute path of a file
+        -file_path_names: A flat list of the absolute path and name of files
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -stage: the name under which the results are cached
+        -file_stats: a dictionary of the stat results of the files already
+            collected by get_file_stats, or None
+
+    @return: an iterator of the results, in the same order as file_path_names
+    """
+    if cache is None:
+        yield from map_files(function, file_path_names, executor)
+        return
+
+    file_stats = [get_file_stat(file_path, file_stats) for file_path in file_path_names]
+    cached_results = cache.get_many(stage, file_stats)
+
+    # Only hash the new or modified files
+    missing_indexes = [i for i, result in enumerate(cached_results) if result is None]
+    missing_file_path_names = [file_path_names[i] for i in missing_indexes]
+    missing_results = map_files(function, missing_file_path_names, executor)
+    new_indexes = []
+    new_results = []
+
+    for i, result in enumerate(cached_results):
+        if result is None:
+            result = next(missing_results)
+            new_indexes.append(i)
+            new_results.append(result)
+            # Store the new results before yielding the last one: the caller
+            # stops asking once it has a result per file, and this generator
+            # is never resumed past its last yield
+            if len(new_results) >= CACHE_BATCH_SIZE or i == missing_indexes[-1]:
+                cache.put_many(stage, [file_path_names[j] for j in new_indexes],
+                               [file_stats[j] for j in new_indexes], new_results)
+                new_indexes = []
+                new_results = []
+        yield result
+
+def regroup_by_condition(groups, function, executor=None, cache=None, stage=None,
+                         file_stats=None):
+    """
+    Split each group of files by condition, the condition of the files of
+    all the groups being calculated in one batch
+
+    @param:
+        -groups: a list of groups of files
+        -function: a function returning the key of a file
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache`` keeping the keys, or None
+        -stage: the name under which the keys are cached
+        -file_stats: a dictionary of the stat results of the files, or None
+
+    @return: an iterator of the groups (with at least two files) which share
+        the same key inside a group, yielded as soon as the keys of the
+        files of their original group are known
+    """
+    groups = list(groups)
+    keys = map_files_with_cache(function,
+        [file_path for group in groups for file_path in group],
+        executor, cache, stage, file_stats)
+
+    for group in groups:
+        # Create a dictionary with the key is filesize or checksum
+        group_by_condition = {}
+
+        # Add link paths as list into dictionary
+        for file_path in group:
+            key = next(keys)
+            # ignore empty file(fuction group_by_size) or broken link(funtion check_sum)
+            if key:
+                group_by_condition.setdefault(key, []).append(file_path)
+
+        # Eliminate lists which have only one file
+        yield from (file_path for file_path in group_by_condition.values()
+                    if len(file_path) > 1)
+
+def group_by_condition(file_path_names, function, executor=None):
     """
     Group by condition
     """
-    # Create a dictionary with the key is filesize or checksum
-    group_by_condition = {}
+    return list(regroup_by_condition([file_path_names], function, executor))
+
+def get_file_stat(file_path_name, file_stats=None):
+    """
+    Get the stat result of a file, without any system call if it has been
+    collected while scanning
 
-    # Add link paths as list into dictionary
-    for file_path in file_path_names:
-        # ignore empty file(fuction group_by_size) or broken link(funtion check_sum)
-        if function(file_path): 
-            group_by_condition.setdefault(function(file_path), []).append(file_path)
-    
-    # Eliminate lists which have only one file
-    return [file_path for file_path in group_by_condition.values() if
-            len(file_path) > 1]
+    @param:
+        -file_path_name: the absolute path of a file
+        -file_stats: a dictionary of the stat results of the files, or None
+
+    @return: an ``os.stat_result``
+    """
+    if file_stats and file_path_name in file_stats:
+        return file_stats[file_path_name]
+    return os.stat(file_path_name)
+
+def regroup_hard_links(groups, regroup, file_stats=None):
+    """
+    Split each group of files with a regroup function which only reads one
+    file per inode: hard links of a same inode have the same content
+
+    @param:
+        -groups: a list of groups of files (with the same size)
+        -regroup: a function taking a list of groups of files, and returning
+            an iterator of the groups of duplicate files
+        -file_stats: a dictionary of the stat results of the files, or None
+
+    @return: an iterator of the groups that contain duplicate files, the
+        hard links of a file being added next to it
+    """
+    candidate_groups = []
+    hard_links = {}  # file path name -> the other hard links of its inode
+
+    for group in groups:
+        group_by_inode = {}
+        for file_path in group:
+            file_stat = get_file_stat(file_path, file_stats)
+            group_by_inode.setdefault((file_stat.st_dev, file_stat.st_ino), []).append(file_path)
+
+        # All the files are hard links of the same inode, nothing to read
+        if len(group_by_inode) == 1:
+            yield group
+            continue
+
+        for file_paths in group_by_inode.values():
+            if len(file_paths) > 1:
+                hard_links[file_paths[0]] = file_paths[1:]
+        candidate_groups.append([file_paths[0] for file_paths in group_by_inode.values()])
+
+    grouped_file_paths = set()
+    for group in regroup(candidate_groups):
+        grouped_file_paths.update(group)
+        yield [linked_path for file_path in group
+               for linked_path in [file_path] + hard_links.get(file_path, [])]
+
+    # Hard links whose inode has no other duplicate
+    for file_path, linked_paths in hard_links.items():
+        if file_path not in grouped_file_paths:
+            yield [file_path] + linked_paths
 
 # WAYPOINT03: Group Files by their Size
-def group_files_by_size(file_path_names):
+def group_files_by_size(file_path_names, file_stats=None):
     """
     Group files by them their size
 
-    @param: file_path_names: flat list of absolute file path names
+    @param:
+        -file_path_names: flat list of absolute file path names
+        -file_stats: a dictionary of the stat results of the files, or None
 
     @return: a list of groups (with at least two files) which have the same size
     """
- 
+    if file_stats:
+        return group_by_condition(file_path_names,
+            lambda file_path: get_file_stat(file_path, file_stats).st_size)
     return group_by_condition(file_path_names, os.path.getsize)
 
+class Crc32:
+    """
+    Expose ``zlib.crc32`` with the ``update``/``hexdigest`` interface of
+    the ``hashlib`` objects
+    """
+    name = 'crc32'
+    digest_size = 4
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return '%08x' % self.value
+
+# Hash algorithms selectable with the option --hash
+HASH_METHODS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'blake2b': hashlib.blake2b,
+    'crc32': Crc32,
+}
+if xxhash:
+    HASH_METHODS['xxhash'] = xxhash.xxh64
+
+class HashStatistics:
+    """
+    Count the bytes hashed and the time spent reading and hashing them
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def add(self, byte_count, seconds):
+        with self.lock:
+            self.bytes += byte_count
+            self.seconds += seconds
+
+    def throughput(self):
+        """
+        @return: the number of bytes hashed per second
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+HASH_STATISTICS = HashStatistics()
+
+def get_hash_name(method):
+    """
+    @return: the name of a hash algorithm (e.g. 'md5'), used to tell apart
+        the cached checksums of different algorithms
+    """
+    return method().name.lower()
+
+# Read buffer of each thread, reused from one file to another
+_THREAD_BUFFERS = threading.local()
+
+def map_file(file_path_name):
+    """
+    Map the content of a file in memory, read-only
+
+    @param: file_path_name: the absolute path of a file
+
+    @return: a ``mmap.mmap`` object, or None if the file cannot be mapped
+        (e.g. an empty file or a special file)
+    """
+    try:
+        with open(file_path_name, 'rb') as file_map:
+            return mmap.mmap(file_map.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
 # WAYPOINT04: Generate a Hash Value for a File
-def get_file_checksum(file_path_name, method=hashlib.md5):
+def get_file_checksum(file_path_name, method=hashlib.md5, buffer=None, use_mmap=False):
     """
-    Get the MD5 hash value of the content of the file
+    Get the hash value of the content of the file
 
     @param: 
         -file_path_name: the absolute path of a file
         -method with default value hashlib.md5
+        -buffer: a bytearray reused to read the file, the buffer of the
+            current thread if not given
+        -use_mmap: hash the file mapped in memory, without copying its
+            content, if it can be mapped
 
-    @return: MD5 hash value of the content of this file
+    @return: hash value of the content of this file
     """
-    # Calculate hash file contents by open, read, close file
-    with open(file_path_name, 'rb') as file_check:
-        data = file_check.read()
-    return method(data).hexdigest()
+    checksum = method()
+
+    if use_mmap:
+        start = time.perf_counter()
+        mapping = map_file(file_path_name)
+        if mapping is not None:
+            with mapping:
+                checksum.update(mapping)
+                HASH_STATISTICS.add(len(mapping), time.perf_counter() - start)
+            return checksum.hexdigest()
+
+    if buffer is None:
+        buffer = getattr(_THREAD_BUFFERS, 'buffer', None)
+        if buffer is None:
+            buffer = _THREAD_BUFFERS.buffer = bytearray(BUFSIZE)
+    view = memoryview(buffer)
+    file_size = 0
+    start = time.perf_counter()
+
+    # Calculate hash file contents chunk by chunk in the same buffer,
+    # never the whole file at once
+    with open(file_path_name, 'rb', buffering=0) as file_check:
+        while True:
+            read_size = file_check.readinto(buffer)
+            if not read_size:
+                break
+            checksum.update(view[:read_size])
+            file_size += read_size
+
+    HASH_STATISTICS.add(file_size, time.perf_counter() - start)
+    return checksum.hexdigest()
 
 # WAYPOINT05: Group Files by their Checksum
-def group_files_by_checksum(file_path_names):
+def group_files_by_checksum(file_path_names, method=hashlib.md5, executor=None,
+                            cache=None, use_mmap=False):
     """
     Group files by their checksum
 
-    @param: file_path_names: A flat list of the absolute path and name of files
+    @param:
+        -file_path_names: A flat list of the absolute path and name of files
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -use_mmap: hash the files mapped in memory
 
     @return: A list of groups that contain duplicate files
     """
-    return group_by_condition(file_path_names, get_file_checksum)
+    return list(regroup_files_by_checksum([file_path_names], method, executor, cache,
+                                          use_mmap=use_mmap))
+
+def regroup_files_by_checksum(groups, method=hashlib.md5, executor=None, cache=None,
+                              file_stats=None, use_mmap=False):
+    """
+    Split each group of files by their checksum
+
+    @param:
+        -groups: a list of groups of files
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -file_stats: a dictionary of the stat results of the files, or None
+        -use_mmap: hash the files mapped in memory
+
+    @return: An iterator of the groups that contain duplicate files
+    """
+    return regroup_by_condition(groups,
+        functools.partial(get_file_checksum, method=method, use_mmap=use_mmap),
+        executor, cache, 'checksum-%s' % get_hash_name(method), file_stats)
 
 # WAYPOINT06: Find all Duplicate Files
-def find_duplicate_files(file_path_names):
+def find_duplicate_files(file_path_names, *args, **kwargs):
     """
     Find all duplicate files (by checking their size and checksum)
 
-    @Param: file_path_names: A flat list of the absolute path and name of files
+    @Param: the arguments of iter_duplicate_files
 
     @Return: a list of groups that contain duplicate files
     """
-    group_by_dup = []
+    return list(iter_duplicate_files(file_path_names, *args, **kwargs))
 
-    # Group file by size first then check checksum
-    for file_path in group_files_by_size(file_path_names):
-        group_by_dup.extend(group_files_by_checksum(file_path))
+def iter_duplicate_files(file_path_names, method=hashlib.md5, executor=None,
+                         cache=None, file_stats=None, use_mmap=False):
+    """
+    Find all duplicate files (by checking their size and checksum), each
+    group being yielded as soon as it is confirmed
 
-    return group_by_dup
+    @Param:
+        -file_path_names: A flat list of the absolute path and name of files
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -file_stats: a dictionary of the stat results of the files, or None
+        -use_mmap: hash the files mapped in memory
+
+    @Return: an iterator of the groups that contain duplicate files
+    """
+    # Group file by size first then check checksum of all of them at once
+    return regroup_hard_links(group_files_by_size(file_path_names, file_stats),
+        lambda groups: regroup_files_by_checksum(groups, method, executor, cache,
+                                                 file_stats, use_mmap),
+        file_stats)
 
 # WAYPOINT07: Output a JSON Expression
 def format_print(path_list):
@@ -151,6 +767,18 @@ def format_print(path_list):
     """
     return json.dumps(path_list, indent=4)
 
+def write_ndjson(path_lists, output=sys.stdout):
+    """
+    Write each list as one JSON line, as soon as it is produced
+
+    @param:
+        -path_lists: an iterable of lists of the absolute path and name of files
+        -output: the text stream to write to
+    """
+    for path_list in path_lists:
+        output.write(json.dumps(path_list) + '\n')
+        output.flush()
+
 # WAYPOINT08: Performance Optimization (Bonus)
 BUFSIZE=64*1024
 
@@ -179,56 +807,538 @@ def do_cmp(f1, f2):
             if not b1:
                 return True
 
-def group_files_by_compare(file_path_names):
+# Maximum number of bytes held in memory by one round of a k-way comparison
+COMPARE_MEMORY_SIZE = 64 * 1024 * 1024
+
+def group_files_by_compare(file_path_names, max_open_files=None, use_mmap=False):
     """
-    Group files by compare their contents
-    
-    @param: file_path_names: A flat list of the absolute path and name of files
+    Group files by compare their contents, all the files being read
+    together chunk by chunk so that each byte is read only once
+
+    @param:
+        -file_path_names: A flat list of the absolute path and name of files
+            (with the same size)
+        -max_open_files: the maximum number of files kept open at once, the
+            other files are reopened at each chunk; no limit if None
+        -use_mmap: compare slices of the files mapped in memory instead of
+            reading them, the files which cannot be mapped are read
 
     @return: A list of groups that contain duplicate files
-    
     """
     result = []
+    open_files = {}  # file path name -> file object kept open
+    mapped_files = {}  # file path name -> mmap of the file, or None
 
-    while file_path_names:
-        
-        file_path_names_update = []
-        dupl_file_group = [] # store duplicate files groups
-        first_ele_tmp = file_path_names[0] 
-        dupl_file_group.append(first_ele_tmp)
-
-        # Always compare the rest to the first element of the list
-        for file_path in file_path_names[1:]:
-            if do_cmp(first_ele_tmp, file_path):
-                dupl_file_group.append(file_path)
-            else:
-                # Store file_path_name updated (eleminated duplicate files) to compare next loops
-                file_path_names_update.append(file_path) 
-        
-        if len(dupl_file_group) > 1: #eleminate lists which have only one element
-            result.append(dupl_file_group)
+    # Smaller chunks for large groups to bound the memory of one round
+    bufsize = max(4096, min(BUFSIZE, COMPARE_MEMORY_SIZE // max(len(file_path_names), 1)))
+
+    def read_chunk(file_path, offset):
+        if file_path in open_files:
+            return open_files[file_path].read(bufsize)
+        if use_mmap:
+            if file_path not in mapped_files and (max_open_files is None
+                    or len(open_files) + len(mapped_files) < max_open_files):
+                mapped_files[file_path] = map_file(file_path)
+            # Slicing the mapping is a plain memory copy, no system call; bytes
+            # are compared far faster than memoryview slices item by item
+            if mapped_files.get(file_path) is not None:
+                return mapped_files[file_path][offset:offset + bufsize]
+        if max_open_files is None or len(open_files) + len(mapped_files) < max_open_files:
+            file_object = open_files[file_path] = open(file_path, 'rb')
+            file_object.seek(offset)
+            return file_object.read(bufsize)
+        # Over the limit: reopen the file for this chunk only
+        with open(file_path, 'rb') as file_object:
+            file_object.seek(offset)
+            return file_object.read(bufsize)
 
-        # Update file_path_name list to avoiding to duplicate check  
-        file_path_names = file_path_names_update
+    def close_files(file_paths):
+        for file_path in file_paths:
+            file_object = open_files.pop(file_path, None)
+            if file_object:
+                file_object.close()
+            mapping = mapped_files.pop(file_path, None)
+            if mapping is not None:
+                mapping.close()
+
+    try:
+        # Groups of files whose contents have been equal so far
+        candidate_groups = [file_path_names] if len(file_path_names) > 1 else []
+        offset = 0
+
+        while candidate_groups:
+            next_candidate_groups = []
+            for group in candidate_groups:
+                # Split the group whenever the chunks differ
+                group_by_chunk = {}
+                for file_path in group:
+                    group_by_chunk.setdefault(read_chunk(file_path, offset), []).append(file_path)
+
+                for chunk, same_chunk_files in group_by_chunk.items():
+                    if len(same_chunk_files) < 2: #eleminate lists which have only one element
+                        close_files(same_chunk_files)
+                    elif not chunk: # end of the files reached
+                        result.append(same_chunk_files)
+                        close_files(same_chunk_files)
+                    else:
+                        next_candidate_groups.append(same_chunk_files)
+
+            candidate_groups = next_candidate_groups
+            offset += bufsize
+    finally:
+        close_files(list(open_files) + list(mapped_files))
 
     return result
 
-def find_duplicate_files_by_compare(file_path_names):
+def regroup_files_by_compare(groups, executor=None, max_open_files=None, use_mmap=False):
+    """
+    Split each group of files by comparing their contents, the groups
+    being compared in parallel if an executor is given
+
+    @param:
+        -groups: a list of groups of files
+        -executor: an executor returned by create_executor, or None
+        -max_open_files: the maximum number of files kept open at once by
+            each comparison; no limit if None
+        -use_mmap: compare the files mapped in memory
+
+    @return: An iterator of the groups that contain duplicate files
+    """
+    compare = functools.partial(group_files_by_compare, max_open_files=max_open_files,
+                                use_mmap=use_mmap)
+
+    # Results are merged in the order of the groups
+    for duplicate_groups in (map(compare, groups) if executor is None
+                             else executor.map(compare, groups)):
+        yield from duplicate_groups
+
+def find_duplicate_files_by_compare(file_path_names, *args, **kwargs):
     """
     Find all duplicate files (by checking their size and comparing contents)
 
-    @Param: file_path_names: A flat list of the absolute path and name of files
+    @Param: the arguments of iter_duplicate_files_by_compare
 
     @Return: a list of groups that contain duplicate files
     """
+    return list(iter_duplicate_files_by_compare(file_path_names, *args, **kwargs))
+
+def iter_duplicate_files_by_compare(file_path_names, executor=None, file_stats=None,
+                                    max_open_files=None, use_mmap=False):
+    """
+    Find all duplicate files (by checking their size and comparing contents),
+    each group being yielded as soon as it is confirmed
 
-    group_by_dup = []
+    @Param:
+        -file_path_names: A flat list of the absolute path and name of files
+        -executor: an executor returned by create_executor, or None
+        -file_stats: a dictionary of the stat results of the files, or None
+        -max_open_files: the maximum number of files kept open at once by
+            each comparison; no limit if None
+        -use_mmap: compare the files mapped in memory
 
+    @Return: an iterator of the groups that contain duplicate files
+    """
     # Group file by size first then compare
-    for file_path in group_files_by_size(file_path_names):
-        group_by_dup.extend(group_files_by_compare(file_path))
+    return regroup_hard_links(group_files_by_size(file_path_names, file_stats),
+        lambda groups: regroup_files_by_compare(groups, executor, max_open_files,
+                                                use_mmap),
+        file_stats)
+
+# Staged pipeline: size -> partial checksum -> full checksum (or compare)
+PARTIAL_SIZE = 4 * 1024
+
+def get_file_partial_checksum(file_path_name, partial_size=PARTIAL_SIZE,
+                              method=hashlib.md5):
+    """
+    Get the hash value of the first and the last bytes of a file
+
+    @param:
+        -file_path_name: the absolute path of a file
+        -partial_size: number of bytes read at the head and at the tail
+        -method with default value hashlib.md5
+
+    @return: hash value of the head and the tail of this file
+    """
+    checksum = method()
+
+    with open(file_path_name, 'rb') as file_check:
+        # Small file: the head and the tail overlap, hash the whole content
+        if os.fstat(file_check.fileno()).st_size <= 2 * partial_size:
+            checksum.update(file_check.read())
+        else:
+            checksum.update(file_check.read(partial_size))
+            file_check.seek(-partial_size, os.SEEK_END)
+            checksum.update(file_check.read(partial_size))
+    return checksum.hexdigest()
+
+def group_files_by_partial_checksum(file_path_names, partial_size=PARTIAL_SIZE,
+                                    method=hashlib.md5, executor=None, cache=None):
+    """
+    Group files by the checksum of their first and last bytes
+
+    @param:
+        -file_path_names: A flat list of the absolute path and name of files
+        -partial_size: number of bytes read at the head and at the tail
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+
+    @return: A list of groups that may contain duplicate files
+    """
+    return list(regroup_files_by_partial_checksum([file_path_names], partial_size,
+                                                  method, executor, cache))
+
+def regroup_files_by_partial_checksum(groups, partial_size=PARTIAL_SIZE,
+                                      method=hashlib.md5, executor=None, cache=None,
+                                      file_stats=None):
+    """
+    Split each group of files by the checksum of their first and last bytes
+
+    @param:
+        -groups: a list of groups of files
+        -partial_size: number of bytes read at the head and at the tail
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -file_stats: a dictionary of the stat results of the files, or None
+
+    @return: An iterator of the groups that may contain duplicate files
+    """
+    return regroup_by_condition(groups, functools.partial(get_file_partial_checksum,
+        partial_size=partial_size, method=method), executor,
+        cache, 'partial-%d-%s' % (partial_size, get_hash_name(method)), file_stats)
+
+FINAL_STAGES = ('checksum', 'compare')
+
+def find_duplicate_files_by_stages(file_path_names, *args, **kwargs):
+    """
+    Find all duplicate files by dropping candidates as early as possible
+
+    @Param: the arguments of iter_duplicate_files_by_stages
+
+    @Return: a list of groups that contain duplicate files
+    """
+    return list(iter_duplicate_files_by_stages(file_path_names, *args, **kwargs))
+
+def iter_duplicate_files_by_stages(file_path_names, partial_size=PARTIAL_SIZE,
+                                   final_stage='checksum', method=hashlib.md5,
+                                   executor=None, cache=None, file_stats=None,
+                                   max_open_files=None, use_mmap=False):
+    """
+    Find all duplicate files by dropping candidates as early as possible:
+    group them by size, then by the checksum of their head and tail, and
+    only the files which survived are read in full. Each group is yielded
+    as soon as it is confirmed.
+
+    @Param:
+        -file_path_names: A flat list of the absolute path and name of files
+        -partial_size: number of bytes read at the head and at the tail of
+            each file, 0 to skip the partial checksum stage
+        -final_stage: 'checksum' or 'compare', the stage which reads the
+            surviving files in full
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -file_stats: a dictionary of the stat results of the files, or None
+        -max_open_files: the maximum number of files kept open at once by
+            each comparison of the compare final stage; no limit if None
+        -use_mmap: read the surviving files in full mapped in memory
+
+    @Return: an iterator of the groups that contain duplicate files
+    """
+    return regroup_hard_links(group_files_by_size(file_path_names, file_stats),
+        functools.partial(regroup_files_by_stages, partial_size=partial_size,
+            final_stage=final_stage, method=method, executor=executor, cache=cache,
+            file_stats=file_stats, max_open_files=max_open_files, use_mmap=use_mmap),
+        file_stats)
+
+def regroup_files_by_stages(candidate_groups, partial_size=PARTIAL_SIZE,
+                            final_stage='checksum', method=hashlib.md5,
+                            executor=None, cache=None, file_stats=None,
+                            max_open_files=None, use_mmap=False):
+    """
+    Split each group of files (with the same size) by the checksum of their
+    head and tail, then by their full content
+
+    @param: the groups of files, and the arguments of iter_duplicate_files_by_stages
+
+    @return: an iterator of the groups that contain duplicate files
+    """
+    if partial_size:
+        candidate_groups = regroup_files_by_partial_checksum(candidate_groups,
+            partial_size, method, executor, cache, file_stats)
+
+        # The partial checksum already covered the whole content of small files
+        survivor_groups = []
+        for same_partial_files in candidate_groups:
+            if get_file_stat(same_partial_files[0], file_stats).st_size <= 2 * partial_size:
+                yield same_partial_files
+            else:
+                survivor_groups.append(same_partial_files)
+        candidate_groups = survivor_groups
+
+    if final_stage == 'compare':
+        yield from regroup_files_by_compare(candidate_groups, executor,
+                                            max_open_files, use_mmap)
+    else:
+        yield from regroup_files_by_checksum(candidate_groups, method,
+            executor, cache, file_stats, use_mmap)
+
+# Number of files of a compact index read in one batch, the only ones
+# turned into paths at once
+INDEX_BATCH_SIZE = 64 * 1024
+
+def iter_index_batches(groups, batch_size=INDEX_BATCH_SIZE):
+    """
+    @param:
+        -groups: an iterable of groups of file ids
+        -batch_size: the minimum number of files of a batch, but the last
+
+    @return: an iterator of lists of groups of about batch_size files
+    """
+    batch = []
+    file_count = 0
+    for group in groups:
+        batch.append(group)
+        file_count += len(group)
+        if file_count >= batch_size:
+            yield batch
+            batch = []
+            file_count = 0
+    if batch:
+        yield batch
+
+def regroup_index_files_by_checksum(index, groups, function, digest_size, executor=None,
+                                    cache=None, stage=None):
+    """
+    Split each group of files of a compact index by checksum, as
+    regroup_by_condition, the files being carried as ids: only the files
+    of the current batch are turned into paths to be read, and their
+    digests are stored in an array of bytes split by a sort
+
+    @param:
+        -index: a ``path_index.PathIndex``
+        -groups: an iterable of groups of file ids
+        -function: a function returning the hexadecimal digest of a file
+        -digest_size: the number of bytes of a digest
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -stage: the name under which the digests are cached
+
+    @return: an iterator of arrays of the ids of the files (at least two)
+        which share the same digest inside a group
+    """
+    for batch in iter_index_batches(groups):
+        file_ids = array.array('L', itertools.chain.from_iterable(batch))
+        group_numbers = array.array('L', itertools.chain.from_iterable(
+            itertools.repeat(group_number, len(group)) for group_number, group in enumerate(batch)))
+        dir_paths = {}
+        file_path_names = [index.get_path(file_id, dir_paths) for file_id in file_ids]
+        file_stats = {file_path: index.get_stat(file_id)
+                      for file_path, file_id in zip(file_path_names, file_ids)} if cache else None
+
+        digest_ids = array.array('L')
+        digest_group_numbers = array.array('L')
+        digests = bytearray()
+        for file_id, group_number, digest in zip(file_ids, group_numbers,
+                map_files_with_cache(function, file_path_names, executor, cache, stage,
+                                     file_stats)):
+            if digest:
+                digest_ids.append(file_id)
+                digest_group_numbers.append(group_number)
+                digests += bytes.fromhex(digest)
+
+        yield from path_index.split_ids_by_key(digest_ids, digest_group_numbers, digests,
+                                               digest_size)
 
-    return group_by_dup
+def regroup_index_files_by_compare(index, groups, executor=None, max_open_files=None,
+                                   use_mmap=False):
+    """
+    Split each group of files of a compact index by comparing their
+    contents, as regroup_files_by_compare, only the files of the current
+    batch being turned into paths
+
+    @return: an iterator of lists of the ids of duplicate files
+    """
+    for batch in iter_index_batches(groups):
+        dir_paths = {}
+        path_groups = [[index.get_path(file_id, dir_paths) for file_id in group]
+                       for group in batch]
+        file_ids = {file_path: file_id for group, path_group in zip(batch, path_groups)
+                    for file_id, file_path in zip(group, path_group)}
+        for path_group in regroup_files_by_compare(path_groups, executor, max_open_files,
+                                                   use_mmap):
+            yield [file_ids[file_path] for file_path in path_group]
+
+def regroup_index_files_by_stages(index, candidate_groups, partial_size=PARTIAL_SIZE,
+                                  final_stage='checksum', method=hashlib.md5,
+                                  executor=None, cache=None, max_open_files=None,
+                                  use_mmap=False):
+    """
+    Split each group of files of a compact index (with the same size), as
+    regroup_files_by_stages, the files being carried as ids
+
+    @param: the index, groups of file ids, and the arguments of
+        iter_duplicate_files_in_index
+
+    @return: an iterator of groups of the ids of duplicate files
+    """
+    digest_size = method().digest_size
+    if partial_size:
+        candidate_groups = regroup_index_files_by_checksum(index, candidate_groups,
+            functools.partial(get_file_partial_checksum, partial_size=partial_size,
+                              method=method),
+            digest_size, executor, cache,
+            'partial-%d-%s' % (partial_size, get_hash_name(method)))
+
+        # The partial checksum already covered the whole content of small files
+        survivor_groups = []
+        for same_partial_ids in candidate_groups:
+            if index.sizes[same_partial_ids[0]] <= 2 * partial_size:
+                yield same_partial_ids
+            else:
+                survivor_groups.append(same_partial_ids)
+        candidate_groups = survivor_groups
+
+    if final_stage == 'compare':
+        yield from regroup_index_files_by_compare(index, candidate_groups, executor,
+                                                  max_open_files, use_mmap)
+    else:
+        yield from regroup_index_files_by_checksum(index, candidate_groups,
+            functools.partial(get_file_checksum, method=method, use_mmap=use_mmap),
+            digest_size, executor, cache, 'checksum-%s' % get_hash_name(method))
+
+def iter_duplicate_files_in_index(index, partial_size=0, final_stage='checksum',
+                                  method=hashlib.md5, executor=None, cache=None,
+                                  max_open_files=None, use_mmap=False):
+    """
+    Find all duplicate files of a compact index by size, then by the
+    checksum of their head and tail if partial_size is given, then by
+    their full content. The files are carried as ids through all the
+    stages, grouped by sorting arrays of their sizes and digests; only the
+    files being read and the duplicate groups are turned into paths.
+
+    @Param:
+        -index: a ``path_index.PathIndex`` returned by scan_path_index
+        -partial_size: number of bytes read at the head and at the tail of
+            each file, 0 to skip the partial checksum stage
+        -final_stage: 'checksum' or 'compare', the stage which reads the
+            surviving files in full
+        -method with default value hashlib.md5
+        -executor: an executor returned by create_executor, or None
+        -cache: a ``hash_cache.HashCache``, or None
+        -max_open_files: the maximum number of files kept open at once by
+            each comparison of the compare final stage; no limit if None
+        -use_mmap: read the surviving files in full mapped in memory
+
+    @Return: an iterator of the groups that contain duplicate files
+    """
+    dir_paths = {}
+    for group in regroup_hard_links(index.group_ids_by_size(),
+            functools.partial(regroup_index_files_by_stages, index,
+                partial_size=partial_size, final_stage=final_stage, method=method,
+                executor=executor, cache=cache, max_open_files=max_open_files,
+                use_mmap=use_mmap),
+            path_index.IndexFileStats(index)):
+        yield [index.get_path(file_id, dir_paths) for file_id in group]
+
+def iter_similar_files(file_path_names, average_size=chunking.CHUNK_AVERAGE_SIZE,
+                       min_shared_ratio=chunking.MIN_SHARED_RATIO, executor=None,
+                       file_stats=None, max_chunk_files=chunking.MAX_CHUNK_FILES):
+    """
+    Find the pairs of files which share most of their content, by
+    indexing their content-defined chunks
+
+    @param:
+        -file_path_names: A flat list of the absolute path and name of files
+        -average_size: the average size of a chunk, a power of two
+        -min_shared_ratio: the minimum ratio of bytes shared by two files
+        -executor: an executor returned by create_executor, or None; the
+            chunking is CPU-bound, a process pool scales best
+        -file_stats: a dictionary of the stat results of the files, or None
+        -max_chunk_files: the chunks found in more files than this are not
+            counted
+
+    @return: an iterator of dictionaries with the paths of two files, the
+        number of bytes they share and its ratio, the most similar first
+    """
+    # Empty files share nothing
+    file_path_names = [file_path for file_path in file_path_names
+                       if get_file_stat(file_path, file_stats).st_size]
+    index = chunking.ChunkIndex(max_chunk_files)
+    for file_path, (digests, lengths) in zip(file_path_names, map_files(
+            functools.partial(chunking.get_file_chunks, average_size=average_size),
+            file_path_names, executor)):
+        index.add_file(file_path, digests, lengths)
+    return iter(index.get_similar_file_pairs(min_shared_ratio))
+
+def create_scan_filter(path, arguments):
+    """
+    @param:
+        -path: the absolute path of the root directory
+        -arguments: the parsed command-line arguments
+
+    @return: a ``scan_filter.ScanFilter`` of the filter arguments, or None
+        if there is no filter
+    """
+    if not (arguments.include or arguments.exclude or arguments.include_regex
+            or arguments.exclude_regex or arguments.min_size is not None
+            or arguments.max_size is not None or arguments.one_file_system
+            or arguments.exclude_fs):
+        return None
+    return scan_filter.ScanFilter(arguments.include, arguments.exclude,
+        arguments.include_regex, arguments.exclude_regex, arguments.min_size,
+        arguments.max_size, path, arguments.one_file_system, arguments.exclude_fs)
+
+def watch_duplicate_files(path, arguments, file_filter=None):
+    """
+    Index the files of a tree, then keep the duplicate groups up to date
+    as the tree changes, until interrupted (Ctrl-C or SIGTERM)
+
+    @param:
+        -path: the absolute path of the root directory
+        -arguments: the parsed command-line arguments
+        -file_filter: a ``scan_filter.ScanFilter``, or None
+    """
+    method = HASH_METHODS[arguments.hash]
+    index = duplicate_index.DuplicateIndex(
+        functools.partial(get_file_checksum, method=method, use_mmap=arguments.mmap),
+        get_hash_name(method))
+    if arguments.index and os.path.exists(arguments.index):
+        if not index.load(arguments.index):
+            print(f'{arguments.index} ignored: not indexed with {arguments.hash}',
+                  file=sys.stderr)
+
+    def output_duplicate_groups(*_):
+        if arguments.output == 'ndjson':
+            write_ndjson(index.get_duplicate_groups())
+        else:
+            print(format_print(index.get_duplicate_groups()), flush=True)
+
+    def stop(*_):
+        sys.exit(0)
+
+    # Expose the current groups on demand
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, output_duplicate_groups)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        duplicate_index.watch_duplicate_files(path, index,
+            lambda dir_path: get_file_stats(scan_file_entries(dir_path, arguments.jobs,
+                                                              file_filter)),
+            arguments.watch_interval, file_filter,
+            on_scanned=lambda index: print(f'watching {len(index.file_stats)} files',
+                                           file=sys.stderr))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if arguments.index:
+            index.save(arguments.index)
+        output_duplicate_groups()
+
+METHODS = ('checksum', 'compare', 'staged', 'chunks')
+OUTPUT_FORMATS = ('json', 'ndjson')
 
 def main():
     """
@@ -237,6 +1347,12 @@ def main():
     start = time.time()
     arguments = parse_arguments()
 
+    if arguments.vacuum_cache:
+        with hash_cache.HashCache(arguments.cache) as cache:
+            removed_count = cache.vacuum(arguments.cache_eviction_days)
+        print(f'{removed_count} checksums removed from the cache')
+        return
+
     # Check if exist path name
     if not check_exist_pathname(arguments.path):
         print("Not a exist path")
@@ -245,18 +1361,87 @@ def main():
     # Convert specified path to a normalized absolutized version of the pathname path
     path = os.path.abspath(arguments.path)
 
-    # A flat list of files from the specified path as 'file_path_name'
-    file_path_names = scan_files(path)
-    
-    # TEST WAYPOINT07
-    # print(format_print(find_duplicate_files(file_path_names)))
-    # end_checksum = time.time()
-    # print(f'checksum_function finished in {str(end_checksum-start)} secs')
-    
-    # TEST WAYPOINT08
-    print(format_print(find_duplicate_files_by_compare(file_path_names)))
-    end_compare = time.time()
-    print(f'compare_function finished in {str(end_compare-start)} secs')
+    if arguments.watch:
+        watch_duplicate_files(path, arguments, create_scan_filter(path, arguments))
+        return
+
+    # A flat list of files from the specified path as 'file_path_name',
+    # with the stat result collected while scanning
+    file_filter = create_scan_filter(path, arguments)
+    if arguments.compact_index:
+        # The files stay ids of the index until they are read
+        index = scan_path_index(path, arguments.jobs, file_filter)
+    else:
+        file_entries = scan_file_entries(path, arguments.jobs, file_filter)
+        file_path_names = [entry.path for entry in file_entries]
+        file_stats = get_file_stats(file_entries)
+
+    method = HASH_METHODS[arguments.hash]
+    # --final-stage only applies to the staged method
+    staged = arguments.method == 'staged'
+    final_stage = arguments.final_stage if staged else arguments.method
+
+    # A compare task opens at least two files at once, and shares the open
+    # file limit with the other workers
+    files_per_task = 2 if final_stage == 'compare' else 1
+    executor = create_executor(arguments.jobs, arguments.pool,
+                               arguments.max_open_files, files_per_task)
+    max_open_files_per_task = arguments.max_open_files and max(files_per_task,
+        arguments.max_open_files // get_worker_count(arguments.jobs,
+            arguments.max_open_files, files_per_task))
+
+    cache = hash_cache.HashCache(arguments.cache) if arguments.cache else None
+
+    with executor or contextlib.nullcontext(), cache or contextlib.nullcontext():
+        if arguments.compact_index:
+            duplicate_files = iter_duplicate_files_in_index(index,
+                partial_size=arguments.partial_size * 1024 if staged else 0,
+                final_stage=final_stage,
+                method=method, executor=executor, cache=cache,
+                max_open_files=max_open_files_per_task, use_mmap=arguments.mmap)
+        elif arguments.method == 'staged':
+            duplicate_files = iter_duplicate_files_by_stages(file_path_names,
+                partial_size=arguments.partial_size * 1024,
+                final_stage=arguments.final_stage, method=method,
+                executor=executor, cache=cache, file_stats=file_stats,
+                max_open_files=max_open_files_per_task, use_mmap=arguments.mmap)
+        elif arguments.method == 'chunks':
+            duplicate_files = iter_similar_files(file_path_names,
+                arguments.chunk_size * 1024, arguments.min_shared_ratio,
+                executor, file_stats, arguments.max_chunk_files)
+        elif arguments.method == 'checksum':
+            duplicate_files = iter_duplicate_files(file_path_names, method,
+                executor, cache, file_stats, arguments.mmap)
+        else:
+            duplicate_files = iter_duplicate_files_by_compare(file_path_names,
+                executor, file_stats, max_open_files_per_task, arguments.mmap)
+
+        if arguments.action != 'report':
+            # Files found by checksum are compared byte by byte before linking,
+            # including the small files the partial checksum stage covered whole
+            link_report = deduplicate.LinkReport()
+            duplicate_files = deduplicate.link_duplicate_groups(duplicate_files,
+                arguments.action, link_report, dry_run=arguments.dry_run,
+                verify=final_stage != 'compare' or (staged and arguments.partial_size > 0))
+
+        if arguments.output == 'ndjson':
+            write_ndjson(duplicate_files)
+        else:
+            print(format_print(list(duplicate_files)))
+
+    # Keep the standard output a valid NDJSON stream
+    report = sys.stderr if arguments.output == 'ndjson' else sys.stdout
+    end = time.time()
+    print(f'{arguments.method}_function finished in {str(end-start)} secs', file=report)
+    if HASH_STATISTICS.bytes:
+        print(f'{arguments.hash} hashed {HASH_STATISTICS.bytes} bytes at '
+              f'{HASH_STATISTICS.throughput():.0f} bytes/s', file=report)
+    if cache:
+        print(f'cache: {cache.hits} hits, {cache.misses} misses '
+              f'({cache.hit_ratio():.1%} hit ratio)', file=report)
+    if arguments.action != 'report':
+        print(f'{arguments.action}{" (dry run)" if arguments.dry_run else ""}: '
+              f'{link_report}', file=report)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+#A persistent cache of file checksums, stored in a SQLite database, so that
+#repeated scans of the same trees only hash new or changed files.
+
+import os
+import sqlite3
+import time
+
+ONE_DAY = 24 * 60 * 60
+
+# Default number of days after which an unused checksum is evicted
+CACHE_EVICTION_DAYS = 30
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS file_checksum (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    path TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (device, inode, stage)) WITHOUT ROWID"""
+SELECT_CHECKSUM = """SELECT size, mtime_ns, checksum FROM file_checksum
+    WHERE device = ? AND inode = ? AND stage = ?"""
+UPDATE_LAST_USED = """UPDATE file_checksum SET last_used = ?
+    WHERE device = ? AND inode = ? AND stage = ?"""
+INSERT_CHECKSUM = """INSERT OR REPLACE INTO file_checksum
+    (device, inode, stage, size, mtime_ns, checksum, path, last_used)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+SELECT_ENTRIES = """SELECT device, inode, stage, size, mtime_ns, path
+    FROM file_checksum"""
+DELETE_CHECKSUM = """DELETE FROM file_checksum
+    WHERE device = ? AND inode = ? AND stage = ?"""
+DELETE_UNUSED = "DELETE FROM file_checksum WHERE last_used < ?"
+
+
+class HashCache:
+    """
+    Checksums of files keyed by (device, inode, stage), only valid while
+    the size and the modification time of the file are unchanged
+    """
+    def __init__(self, file_path_name):
+        """
+        Open (and create if needed) the cache database
+
+        @param: file_path_name: path and name of the SQLite database file
+        """
+        self.connection = sqlite3.connect(os.path.expanduser(file_path_name))
+        self.connection.execute(CREATE_TABLE)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """
+        Commit the pending changes and close the database
+        """
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_many(self, stage, file_stats):
+        """
+        Get the cached checksums of files
+
+        @param:
+            -stage: name of the checksum (e.g. 'checksum-md5')
+            -file_stats: a list of ``os.stat_result`` of the files
+
+        @return: the list of checksums, None for files which are not cached
+            or which have been modified since they were cached
+        """
+        now = int(time.time())
+        checksums = []
+        used_keys = []
+
+        for file_stat in file_stats:
+            key = (file_stat.st_dev, file_stat.st_ino, stage)
+            row = self.connection.execute(SELECT_CHECKSUM, key).fetchone()
+            if row and row[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+                checksums.append(row[2])
+                used_keys.append((now, *key))
+            else:
+                checksums.append(None)
+
+        self.connection.executemany(UPDATE_LAST_USED, used_keys)
+        self.hits += len(used_keys)
+        self.misses += len(file_stats) - len(used_keys)
+        return checksums
+
+    def put_many(self, stage, file_path_names, file_stats, checksums):
+        """
+        Store the checksums of files
+
+        @param:
+            -stage: name of the checksum (e.g. 'checksum-md5')
+            -file_path_names: a list of absolute path and name of files
+            -file_stats: the list of ``os.stat_result`` of these files,
+                taken before they were hashed
+            -checksums: the list of checksums of these files
+        """
+        now = int(time.time())
+        self.connection.executemany(INSERT_CHECKSUM, [
+            (file_stat.st_dev, file_stat.st_ino, stage, file_stat.st_size,
+             file_stat.st_mtime_ns, checksum, file_path, now)
+            for file_path, file_stat, checksum in zip(file_path_names, file_stats, checksums)
+            if checksum])
+        self.connection.commit()
+
+    def evict(self, days=CACHE_EVICTION_DAYS):
+        """
+        Remove the checksums of files which do not exist anymore, which
+        have been modified, or which have not been used for some days
+
+        @param: days: number of days after which an unused checksum is removed
+
+        @return: the number of checksums removed
+        """
+        stale_keys = []
+        for device, inode, stage, size, mtime_ns, path in \
+                self.connection.execute(SELECT_ENTRIES).fetchall():
+            try:
+                file_stat = os.stat(path, follow_symlinks=False)
+            except OSError:
+                stale_keys.append((device, inode, stage))
+                continue
+            if (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns) \
+                    != (device, inode, size, mtime_ns):
+                stale_keys.append((device, inode, stage))
+
+        self.connection.executemany(DELETE_CHECKSUM, stale_keys)
+        removed_count = len(stale_keys) + self.connection.execute(
+            DELETE_UNUSED, (int(time.time()) - days * ONE_DAY,)).rowcount
+        self.connection.commit()
+        return removed_count
+
+    def vacuum(self, days=CACHE_EVICTION_DAYS):
+        """
+        Evict the stale checksums and shrink the database file
+
+        @param: days: number of days after which an unused checksum is removed
+
+        @return: the number of checksums removed
+        """
+        removed_count = self.evict(days)
+        self.connection.execute('VACUUM')
+        return removed_count
+
+    def hit_ratio(self):
+        """
+        @return: the ratio of files whose checksum was found in the cache
+        """
+        lookup_count = self.hits + self.misses
+        return self.hits / lookup_count if lookup_count else 0.0
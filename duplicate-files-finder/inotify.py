@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+#A minimal binding of the Linux inotify API with ctypes, to be notified of
+#the files created, modified or removed in watched directories.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+
+# Events of inotify(7)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0o2000000
+
+# Events changing the content or the list of the files of a directory
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+# Header of an event: watch descriptor, mask, cookie and length of the name
+EVENT_HEADER = struct.Struct('iIII')
+
+# Size of the buffer the events are read into
+EVENT_BUFFER_SIZE = 64 * 1024
+
+
+def load_libc():
+    """
+    @return: the C library exposing the inotify functions, or None if the
+        platform has none
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+_LIBC = load_libc()
+
+
+class Inotify:
+    """
+    An inotify instance, watching directories
+    """
+    def __init__(self):
+        """
+        @raise OSError: if inotify is not available on this platform
+        """
+        if _LIBC is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available on this platform')
+        self.fd = _LIBC.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        Watch a directory
+
+        @param:
+            -path: the absolute path of a directory
+            -mask: the events to be notified of
+
+        @return: the watch descriptor of this directory
+
+        @raise OSError: if the directory cannot be watched
+        """
+        watch_descriptor = _LIBC.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if watch_descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return watch_descriptor
+
+    def remove_watch(self, watch_descriptor):
+        """
+        Stop watching a directory, ignoring a watch already removed by the
+        kernel (e.g. of a deleted directory)
+        """
+        _LIBC.inotify_rm_watch(self.fd, watch_descriptor)
+
+    def read_events(self):
+        """
+        Wait for events and read all the pending ones
+
+        @return: a list of tuples (watch_descriptor, mask, cookie, name),
+            name being empty for an event of the watched directory itself
+        """
+        data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        events = []
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, cookie, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            events.append((watch_descriptor, mask, cookie, name))
+        return events
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+#A compact index of the files of a scan: the directories are interned once,
+#and the names, sizes and inodes of the files are stored in flat arrays
+#rather than in Python strings and stat results, so that trees of hundreds
+#of millions of files fit in memory. The files are grouped as ids, by
+#sorting arrays of their sizes and digests; only the files being read and
+#the duplicate files are turned back into paths.
+
+import array
+import collections
+import collections.abc
+import itertools
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The fields of a stat result used by the finder, built from the index
+FileStat = collections.namedtuple('FileStat', 'st_size st_dev st_ino st_mtime_ns')
+
+
+class PathIndex:
+    """
+    Directories stored as the id of their parent and the offset of their
+    name, files as the id of their directory and the offset of their name,
+    the names being concatenated in a single buffer
+    """
+    def __init__(self):
+        self.names = bytearray()                # encoded names, concatenated
+        self.dir_parent_ids = array.array('l')  # directory id -> parent id, -1 for a root
+        self.dir_name_offsets = array.array('Q')
+        self.dir_name_lengths = array.array('H')
+        self.file_dir_ids = array.array('L')    # file id -> directory id
+        self.file_name_offsets = array.array('Q')
+        self.file_name_lengths = array.array('H')
+        self.sizes = array.array('Q')
+        self.devices = array.array('Q')
+        self.inodes = array.array('Q')
+        self.mtimes = array.array('q')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def _add_name(self, name):
+        encoded_name = os.fsencode(name)
+        offset = len(self.names)
+        self.names += encoded_name
+        return offset, len(encoded_name)
+
+    def _get_name(self, offset, length):
+        return os.fsdecode(bytes(self.names[offset:offset + length]))
+
+    def add_directory(self, name, parent_id=-1):
+        """
+        @param:
+            -name: the name of a directory, or the absolute path of a root
+            -parent_id: the id of its parent directory, -1 for a root
+
+        @return: the id of the directory
+        """
+        offset, length = self._add_name(name)
+        self.dir_parent_ids.append(parent_id)
+        self.dir_name_offsets.append(offset)
+        self.dir_name_lengths.append(length)
+        return len(self.dir_parent_ids) - 1
+
+    def add_file(self, dir_id, name, file_stat):
+        """
+        @param:
+            -dir_id: the id of the directory of the file
+            -name: the name of the file
+            -file_stat: the ``os.stat_result`` of the file
+        """
+        offset, length = self._add_name(name)
+        self.file_dir_ids.append(dir_id)
+        self.file_name_offsets.append(offset)
+        self.file_name_lengths.append(length)
+        self.sizes.append(file_stat.st_size)
+        self.devices.append(file_stat.st_dev)
+        self.inodes.append(file_stat.st_ino)
+        self.mtimes.append(file_stat.st_mtime_ns)
+
+    def get_dir_path(self, dir_id):
+        """
+        @return: the absolute path of a directory
+        """
+        names = []
+        while dir_id >= 0:
+            names.append(self._get_name(self.dir_name_offsets[dir_id],
+                                        self.dir_name_lengths[dir_id]))
+            dir_id = self.dir_parent_ids[dir_id]
+        return os.path.join(*reversed(names))
+
+    def get_path(self, file_id, dir_paths=None):
+        """
+        @param:
+            -file_id: the id of a file
+            -dir_paths: a dictionary of the paths of the directories already
+                built, by id, to update, or None
+
+        @return: the absolute path of a file
+        """
+        dir_id = self.file_dir_ids[file_id]
+        if dir_paths is None:
+            dir_path = self.get_dir_path(dir_id)
+        else:
+            dir_path = dir_paths.get(dir_id)
+            if dir_path is None:
+                dir_path = dir_paths[dir_id] = self.get_dir_path(dir_id)
+        return os.path.join(dir_path,
+                            self._get_name(self.file_name_offsets[file_id],
+                                           self.file_name_lengths[file_id]))
+
+    def get_stat(self, file_id):
+        """
+        @return: the ``FileStat`` of a file
+        """
+        return FileStat(self.sizes[file_id], self.devices[file_id],
+                        self.inodes[file_id], self.mtimes[file_id])
+
+    def group_ids_by_size(self):
+        """
+        Group the files by size with a sort of the array of sizes rather
+        than a dictionary of lists, vectorised if numpy is installed
+
+        @return: a list of arrays of the ids of the files (at least two, not
+            empty) which have the same size, by increasing size
+        """
+        if numpy is not None and len(self.sizes):
+            sizes = numpy.frombuffer(self.sizes, dtype=numpy.uint64)
+            file_ids = numpy.argsort(sizes, kind='stable')
+            sorted_sizes = sizes[file_ids]
+            starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(sorted_sizes)) + 1))
+            counts = numpy.diff(numpy.append(starts, len(sorted_sizes)))
+            # Only the sizes of several files, empty files excepted
+            repeated = (counts > 1) & (sorted_sizes[starts] > 0)
+            return [array.array('L', file_ids[start:start + count].tolist())
+                    for start, count in zip(starts[repeated].tolist(), counts[repeated].tolist())]
+
+        # Count the sizes first, so that only the ids of the files whose
+        # size is repeated are kept, in an array per size
+        size_counts = collections.Counter(self.sizes)
+        groups = {}
+        for file_id, size in enumerate(self.sizes):
+            if size and size_counts[size] > 1:
+                group = groups.get(size)
+                if group is None:
+                    group = groups[size] = array.array('L')
+                group.append(file_id)
+        return [groups[size] for size in sorted(groups)]
+
+
+class IndexFileStats(collections.abc.Mapping):
+    """
+    The ``FileStat`` of the files of an index by id, built on demand, to
+    stand for the dictionary of stat results of the finder
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, file_id):
+        if file_id not in self:
+            raise KeyError(file_id)
+        return self.index.get_stat(file_id)
+
+    def __contains__(self, file_id):
+        return isinstance(file_id, int) and 0 <= file_id < len(self.index)
+
+    def __iter__(self):
+        return iter(range(len(self.index)))
+
+    def __len__(self):
+        return len(self.index)
+
+
+def split_ids_by_key(file_ids, group_numbers, keys, key_size):
+    """
+    Split groups of files by a key of a fixed number of bytes, such as a
+    digest, with a sort of the keys rather than a dictionary of lists,
+    vectorised if numpy is installed
+
+    @param:
+        -file_ids: an array of the ids of the files of all the groups
+        -group_numbers: an array of the number of the group of each file
+        -keys: a bytes-like object of the keys of the files, concatenated
+        -key_size: the number of bytes of a key
+
+    @return: a list of arrays of the ids of the files (at least two) which
+        share their group and their key, by group
+    """
+    file_count = len(file_ids)
+    if numpy is not None and file_count:
+        # The keys as columns of big-endian integers, padded with zeros
+        column_count = -(-key_size // 8)
+        padded_keys = numpy.zeros((file_count, column_count * 8), dtype=numpy.uint8)
+        padded_keys[:, :key_size] = numpy.frombuffer(keys, dtype=numpy.uint8) \
+            .reshape(file_count, key_size)
+        columns = padded_keys.view('>u8')
+        groups = numpy.frombuffer(group_numbers, dtype=group_numbers.typecode)
+
+        # Sorted by group, then by key; the sort is stable
+        order = numpy.lexsort([columns[:, column] for column in reversed(range(column_count))]
+                              + [groups])
+        columns = columns[order]
+        groups = groups[order]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], (groups[1:] != groups[:-1])
+            | (columns[1:] != columns[:-1]).any(axis=1))))
+        counts = numpy.diff(numpy.append(starts, file_count))
+        sorted_ids = numpy.frombuffer(file_ids, dtype=file_ids.typecode)[order]
+        return [array.array('L', sorted_ids[start:start + count].tolist())
+                for start, count in zip(starts[counts > 1].tolist(), counts[counts > 1].tolist())]
+
+    def get_key(position):
+        return group_numbers[position], keys[position * key_size:(position + 1) * key_size]
+
+    groups = []
+    for _, positions in itertools.groupby(sorted(range(file_count), key=get_key), key=get_key):
+        group = array.array('L', (file_ids[position] for position in positions))
+        if len(group) > 1:
+            groups.append(group)
+    return groups
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+#Rules deciding which directories are descended into and which files are
+#collected while scanning a tree, so that excluded subtrees such as
+#node_modules or .git are never read.
+
+import fnmatch
+import os
+import re
+
+# Table of the mounted file systems on Linux
+MOUNTS_PATH = '/proc/self/mounts'
+
+
+def compile_globs(patterns):
+    """
+    Combine glob patterns into regular expressions: a pattern without a
+    path separator matches the name of a file or directory (e.g.
+    ``node_modules``, ``*.tmp``), other patterns match its absolute path
+
+    @param: patterns: a list of glob patterns
+
+    @return: a tuple (name_regex, path_regex), each one None if there is no
+        such pattern
+    """
+    name_patterns = [fnmatch.translate(pattern) for pattern in patterns
+                     if os.sep not in pattern]
+    path_patterns = [fnmatch.translate(pattern) for pattern in patterns
+                     if os.sep in pattern]
+    return (re.compile('|'.join(name_patterns)) if name_patterns else None,
+            re.compile('|'.join(path_patterns)) if path_patterns else None)
+
+
+def compile_regexes(patterns):
+    """
+    @return: a regular expression searched in absolute paths, which matches
+        if any of the patterns matches, or None if there is no pattern
+    """
+    return re.compile('|'.join('(?:%s)' % pattern for pattern in patterns)) \
+        if patterns else None
+
+
+def get_mount_points(file_system_types):
+    """
+    @param: file_system_types: a list of file system types (e.g. 'nfs')
+
+    @return: the set of the mount points of these file systems, empty if
+        the platform does not list them in MOUNTS_PATH
+    """
+    mount_points = set()
+    try:
+        with open(MOUNTS_PATH) as mounts_file:
+            for line in mounts_file:
+                fields = line.split()
+                if len(fields) > 2 and fields[2] in file_system_types:
+                    # Spaces and tabs are escaped in octal (e.g. '\040')
+                    mount_points.add(re.sub(r'\\([0-7]{3})',
+                        lambda match: chr(int(match.group(1), 8)), fields[1]))
+    except OSError:
+        pass
+    return mount_points
+
+
+class ScanFilter:
+    """
+    Include and exclude rules evaluated by the walker: excluded directories
+    are not descended into, and only the files which pass all the rules are
+    collected
+    """
+    def __init__(self, includes=(), excludes=(), include_regexes=(), exclude_regexes=(),
+                 min_size=None, max_size=None, root_path=None, one_file_system=False,
+                 exclude_file_systems=()):
+        """
+        @param:
+            -includes: glob patterns, files must match one of them if any
+            -excludes: glob patterns of the files and directories to skip
+            -include_regexes: regular expressions, the absolute path of
+                files must match one of them if any
+            -exclude_regexes: regular expressions of the absolute path of
+                the files and directories to skip
+            -min_size, max_size: the bounds, in bytes, of the size of files
+            -root_path: the root directory of the scan
+            -one_file_system: skip the directories on another file system
+                than the root directory, such as mount points
+            -exclude_file_systems: types of file systems whose mount points
+                are skipped (e.g. 'nfs', 'fuse.sshfs')
+        """
+        self.include_name_regex, self.include_path_regex = compile_globs(includes)
+        self.exclude_name_regex, self.exclude_path_regex = compile_globs(excludes)
+        self.include_regex = compile_regexes(include_regexes)
+        self.exclude_regex = compile_regexes(exclude_regexes)
+        self.has_includes = bool(includes or include_regexes)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.device = os.stat(root_path).st_dev if one_file_system else None
+        self.excluded_mount_points = get_mount_points(exclude_file_systems)
+
+    def is_excluded(self, path):
+        """
+        @param: path: the absolute path of a file or a directory
+
+        @return: True if the path matches an exclude rule
+        """
+        return bool(
+            (self.exclude_name_regex and self.exclude_name_regex.match(os.path.basename(path)))
+            or (self.exclude_path_regex and self.exclude_path_regex.match(path))
+            or (self.exclude_regex and self.exclude_regex.search(path)))
+
+    def is_included(self, path):
+        """
+        @param: path: the absolute path of a file
+
+        @return: True if there is no include rule, or if the path matches one
+        """
+        return not self.has_includes or bool(
+            (self.include_name_regex and self.include_name_regex.match(os.path.basename(path)))
+            or (self.include_path_regex and self.include_path_regex.match(path))
+            or (self.include_regex and self.include_regex.search(path)))
+
+    def accept_directory(self, dir_path):
+        """
+        @param: dir_path: the absolute path of a sub-directory
+
+        @return: True if the walker should descend into this directory
+        """
+        if self.is_excluded(dir_path) or dir_path in self.excluded_mount_points:
+            return False
+        if self.device is not None:
+            try:
+                return os.stat(dir_path, follow_symlinks=False).st_dev == self.device
+            except OSError:
+                return False
+        return True
+
+    def accept_file(self, file_path_name, file_stat):
+        """
+        @param:
+            -file_path_name: the absolute path of a file
+            -file_stat: the ``os.stat_result`` of the file
+
+        @return: True if the file should be collected
+        """
+        if self.min_size is not None and file_stat.st_size < self.min_size:
+            return False
+        if self.max_size is not None and file_stat.st_size > self.max_size:
+            return False
+        return not self.is_excluded(file_path_name) and self.is_included(file_path_name)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+#A Command-Line Interface Python script that times the strategies of the
+#duplicate files finder on a directory tree, optionally generated with a
+#seed by generate_duplicate_files.py, and outputs the results in JSON.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+TOOL_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOL_PATH, os.pardir))
+
+import find_duplicate_files as finder
+import generate_duplicate_files as generator
+import hash_cache
+
+
+def find_by_checksum(file_path_names, file_stats, jobs, cache_path):
+    return finder.find_duplicate_files(file_path_names, file_stats=file_stats)
+
+def find_by_checksum_mmap(file_path_names, file_stats, jobs, cache_path):
+    return finder.find_duplicate_files(file_path_names, file_stats=file_stats,
+                                       use_mmap=True)
+
+def find_by_compare(file_path_names, file_stats, jobs, cache_path):
+    return finder.find_duplicate_files_by_compare(file_path_names, file_stats=file_stats)
+
+def find_by_compare_mmap(file_path_names, file_stats, jobs, cache_path):
+    return finder.find_duplicate_files_by_compare(file_path_names, file_stats=file_stats,
+                                                  use_mmap=True)
+
+def find_by_stages(file_path_names, file_stats, jobs, cache_path):
+    return finder.find_duplicate_files_by_stages(file_path_names, file_stats=file_stats)
+
+def find_by_stages_in_parallel(file_path_names, file_stats, jobs, cache_path):
+    with finder.create_executor(jobs) or contextlib.nullcontext() as executor:
+        return finder.find_duplicate_files_by_stages(file_path_names,
+            file_stats=file_stats, executor=executor)
+
+def find_by_stages_with_cache(file_path_names, file_stats, jobs, cache_path):
+    with hash_cache.HashCache(cache_path) as cache:
+        return finder.find_duplicate_files_by_stages(file_path_names,
+            file_stats=file_stats, cache=cache)
+
+
+# Strategies to time: name -> function(file_path_names, file_stats, jobs, cache_path)
+STRATEGIES = {
+    'checksum': find_by_checksum,
+    'checksum-mmap': find_by_checksum_mmap,
+    'compare': find_by_compare,
+    'compare-mmap': find_by_compare_mmap,
+    'staged': find_by_stages,
+    'parallel': find_by_stages_in_parallel,
+    'cached': find_by_stages_with_cache,
+}
+
+# Strategies run once before being timed, to fill their cache
+WARM_UP_STRATEGIES = ('cached',)
+
+
+def parse_arguments():
+    """
+    Convert argument strings to objects and assign them as attributes of
+    the namespace.
+
+    @return: an instance ``argparse.Namespace`` corresponding to the
+        populated namespace.
+    """
+    parser = argparse.ArgumentParser(description='Duplicate Files Finder Benchmark')
+    parser.add_argument('-p', '--path', metavar='PATH',
+        help='The root directory of the files to find duplicates in; with '
+             '--file-count, where to generate them (default: a temporary '
+             'directory removed at the end)')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES),
+        help='A comma-separated list of the strategies to time '
+             '(default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='The number of times each strategy is run, the best time is '
+             'kept (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+        help='The number of workers of the parallel strategy, and of the '
+             'processes generating the tree (default: %(default)s)')
+
+    parser.add_argument('--file-count', type=int,
+        help='Generate a tree of this number of files before timing the strategies')
+    parser.add_argument('--seed', type=int, default=0,
+        help='The seed of the generated tree (default: %(default)s)')
+    parser.add_argument('--duplicate-file-ratio', type=float, default=0.2,
+        help='The ratio of duplicate files of the generated tree (default: %(default)s)')
+    parser.add_argument('--duplicate-method', choices=generator.DUPLICATE_METHODS,
+        default='copy',
+        help='How the duplicate files of the generated tree are created '
+             '(default: %(default)s)')
+    parser.add_argument('--near-duplicate-file-ratio', type=float, default=0.0,
+        help='The ratio of files of the generated tree which only differ from '
+             'another file by their last block (default: %(default)s)')
+    parser.add_argument('--sparse', action='store_true',
+        help='Generate sparse files, only their first and last blocks are written')
+    parser.add_argument('--file-min-size', type=int, default=generator.ONE_KB,
+        help='The minimum size of a generated file (default: %(default)s)')
+    parser.add_argument('--file-max-size', type=int, default=generator.ONE_MB,
+        help='The maximum size of a generated file (default: %(default)s)')
+    parser.add_argument('--file-size-distribution', choices=generator.FILE_SIZE_DISTRIBUTIONS,
+        default='lognormal',
+        help='The distribution of the size of the generated files (default: %(default)s)')
+    parser.add_argument('--keep', action='store_true',
+        help='Keep the generated tree')
+
+    return parser.parse_args()
+
+
+def read_process_io():
+    """
+    @return: a dictionary of the I/O counters of the current process
+        (``syscr``, ``rchar``, ...), empty if the platform has none
+    """
+    try:
+        with open('/proc/self/io') as io_file:
+            return {name: int(value) for name, value in
+                    (line.split(':') for line in io_file)}
+    except OSError:
+        return {}
+
+
+def run_strategy(name, path, jobs, cache_path):
+    """
+    Scan a tree and find its duplicate files with a strategy, in a fresh
+    process so that its peak memory is measured alone
+
+    @return: a dictionary of the measures of this run
+    """
+    io_counters = read_process_io()
+    start = time.perf_counter()
+
+    file_entries = finder.scan_file_entries(path)
+    file_path_names = [entry.path for entry in file_entries]
+    file_stats = finder.get_file_stats(file_entries)
+    duplicate_groups = STRATEGIES[name](file_path_names, file_stats, jobs, cache_path)
+
+    seconds = time.perf_counter() - start
+    end_io_counters = read_process_io()
+    total_size = sum(file_stat.st_size for file_stat in file_stats.values())
+
+    return {
+        'seconds': seconds,
+        'files_per_second': len(file_path_names) / seconds,
+        'megabytes_per_second': total_size / generator.ONE_MB / seconds,
+        'hashed_bytes': finder.HASH_STATISTICS.bytes,
+        'read_syscalls': end_io_counters.get('syscr', 0) - io_counters.get('syscr', 0)
+            if io_counters else None,
+        'read_bytes': end_io_counters.get('rchar', 0) - io_counters.get('rchar', 0)
+            if io_counters else None,
+        # Kilobytes on Linux, bytes on macOS
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'group_count': len(duplicate_groups),
+    }
+
+
+def benchmark_strategy(name, path, jobs=1, repeat=3, cache_path=None):
+    """
+    Time a strategy of the duplicate files finder
+
+    @param:
+        -name: a name of STRATEGIES
+        -path: the root directory of the files
+        -jobs: the number of workers of the parallel strategy
+        -repeat: number of runs, the measures of the fastest one are kept
+        -cache_path: the checksum cache of the cached strategy
+
+    @return: a dictionary of the measures of the fastest run
+    """
+    context = multiprocessing.get_context('spawn')
+
+    def run_in_new_process():
+        with context.Pool(1) as pool:
+            return pool.apply(run_strategy, (name, path, jobs, cache_path))
+
+    if name in WARM_UP_STRATEGIES:
+        run_in_new_process()
+
+    return min((run_in_new_process() for _ in range(repeat)),
+               key=lambda measures: measures['seconds'])
+
+
+def main():
+    """
+    Entry point of the script.
+    """
+    arguments = parse_arguments()
+
+    generated_path = None
+    if arguments.file_count:
+        path = generated_path = os.path.abspath(arguments.path or tempfile.mkdtemp())
+        random.seed(arguments.seed)
+        generator.generate_files(arguments.file_count,
+            duplicate_file_ratio=arguments.duplicate_file_ratio,
+            duplicate_method=arguments.duplicate_method,
+            near_duplicate_file_ratio=arguments.near_duplicate_file_ratio,
+            file_min_size=arguments.file_min_size,
+            file_max_size=arguments.file_max_size,
+            file_size_distribution=arguments.file_size_distribution,
+            root_path=path,
+            sparse=arguments.sparse,
+            jobs=arguments.jobs)
+    elif arguments.path:
+        path = os.path.abspath(arguments.path)
+    else:
+        sys.exit('Either --path or --file-count is required')
+
+    cache_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    try:
+        results = {
+            'tree': {
+                'path': path,
+                'file_count': arguments.file_count,
+                'seed': arguments.seed if arguments.file_count else None,
+                'duplicate_file_ratio': arguments.duplicate_file_ratio
+                    if arguments.file_count else None,
+                'near_duplicate_file_ratio': arguments.near_duplicate_file_ratio
+                    if arguments.file_count else None,
+                'file_size_distribution': arguments.file_size_distribution
+                    if arguments.file_count else None,
+            },
+            'strategies': {name: benchmark_strategy(name, path, arguments.jobs,
+                                                    arguments.repeat, cache_path)
+                           for name in arguments.strategies.split(',')},
+        }
+    finally:
+        shutil.rmtree(os.path.dirname(cache_path))
+        if generated_path and not arguments.keep and not arguments.path:
+            shutil.rmtree(generated_path)
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,9 +18,16 @@
 # SOFTWARE OR ITS DERIVATIVES.
 
 import argparse
+import concurrent.futures
+import contextlib
 import errno
+try:
+    import fcntl
+except ImportError: # Not available on Windows
+    fcntl = None
 import io
 import json
+import math
 import os
 import random
 import shutil
@@ -45,6 +52,24 @@ FILE_MIN_SIZE = ONE_KB
 # Default maximum size of a file to randomly generate.
 FILE_MAX_SIZE = ONE_GB
 
+# Methods to duplicate a file: `copy` its bytes through the process,
+# `copy-file-range` in the kernel, which shares the blocks of the file on
+# some file systems (Btrfs, XFS, NFS...), or `reflink` as a copy-on-write
+# clone, falling back to `copy-file-range` where not supported.
+DUPLICATE_METHODS = ('copy', 'copy-file-range', 'reflink')
+
+# ioctl request cloning a whole file on Linux (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Size of the blocks of random bytes written to a file, rounded down to a
+# multiple of the preferred block size of the file system.
+WRITE_BLOCK_SIZE = 4 * ONE_MB
+
+# Distributions of the size of the files to randomly generate: `uniform`
+# between the minimum and the maximum size, or `lognormal`, many small
+# files and a few large ones, as found on most file systems.
+FILE_SIZE_DISTRIBUTIONS = ('uniform', 'lognormal')
+
 
 def build_tree_pathname(file_name, directory_depth=8, pathname_separator_character=os.sep):
     """
@@ -80,7 +105,28 @@ def build_tree_pathname(file_name, directory_depth=8, pathname_separator_charact
         for i in range(min(directory_depth, len(filename_without_extension)))])
 
 
-def duplicate_file(source_file_path_name, destination_file_path_name):
+def copy_file_range(source_file_path_name, destination_file_path_name):
+    """
+    Copy a file in the kernel, without reading its bytes in the process.
+
+
+    @param source_file_path_name: absolute path and name of a file to copy.
+
+    @param destination_file_path_name: absolute path and name of the copy.
+    """
+    with io.open(source_file_path_name, mode='rb', buffering=0) as source_fd, \
+            io.open(destination_file_path_name, mode='wb', buffering=0) as destination_fd:
+        remaining_size = os.fstat(source_fd.fileno()).st_size
+        while remaining_size > 0:
+            copied_size = os.copy_file_range(source_fd.fileno(), destination_fd.fileno(),
+                remaining_size)
+            if copied_size == 0:
+                break
+            remaining_size -= copied_size
+
+
+def duplicate_file(source_file_path_name, destination_file_path_name,
+        duplicate_method='copy'):
     """
     Duplicate a source file to another path.
 
@@ -90,14 +136,61 @@ def duplicate_file(source_file_path_name, destination_file_path_name):
 
     @param destination_file_path_name: absolute path and name of the
         destination of this source file.
+
+    @param duplicate_method: one of ``DUPLICATE_METHODS``.
     """
+    if duplicate_method == 'reflink' and fcntl:
+        try:
+            with io.open(source_file_path_name, mode='rb') as source_fd, \
+                    io.open(destination_file_path_name, mode='wb') as destination_fd:
+                fcntl.ioctl(destination_fd.fileno(), FICLONE, source_fd.fileno())
+            return
+        except OSError: # The file system does not support reflinks.
+            pass
+
+    if duplicate_method != 'copy' and hasattr(os, 'copy_file_range'):
+        try:
+            copy_file_range(source_file_path_name, destination_file_path_name)
+            return
+        except OSError: # Not supported across these file systems.
+            pass
+
     shutil.copyfile(source_file_path_name, destination_file_path_name)
 
 
+def near_duplicate_file(source_file_path_name, destination_file_path_name,
+        duplicate_method='copy'):
+    """
+    Duplicate a source file to another path, and then invert the bytes of
+    its last block, so that both files only differ at their end.
+
+
+    @param source_file_path_name: absolute path and name of a file to
+        duplicate.
+
+    @param destination_file_path_name: absolute path and name of the near
+        duplicate of this source file.
+
+    @param duplicate_method: one of ``DUPLICATE_METHODS``.
+    """
+    duplicate_file(source_file_path_name, destination_file_path_name,
+        duplicate_method=duplicate_method)
+
+    block_size = os.statvfs(os.path.dirname(destination_file_path_name) or os.curdir).f_bsize
+    with io.open(destination_file_path_name, mode='r+b', buffering=0) as fd:
+        offset = max(fd.seek(0, io.SEEK_END) - block_size, 0)
+        fd.seek(offset)
+        last_block = fd.read(block_size)
+        fd.seek(offset)
+        fd.write(bytes(255 - byte for byte in last_block))
+
+
 def generate_files(file_count,
         directory_max_depth=8,
         directory_min_depth=None,
         duplicate_file_ratio=0.2,
+        duplicate_method='copy',
+        near_duplicate_file_ratio=0.0,
         file_extensions=None,
         file_extension_max_length=3,
         file_extension_min_length=3,
@@ -106,10 +199,18 @@ def generate_files(file_count,
         file_name_min_length=1,
         file_min_size=FILE_MIN_SIZE,
         file_max_size=FILE_MAX_SIZE,
-        root_path=None):
+        file_size_distribution='uniform',
+        root_path=None,
+        sparse=False,
+        jobs=1):
     """
     Generate random files with a certain ratio of duplicate files.
 
+    The names, the sizes and the seeds of the content of the files are
+    first chosen with the module ``random``, so that the same seed
+    generates the same tree, then the files are written by parallel
+    workers, the duplicates once their source file has been written.
+
 
     @param file_count: number of file to generate.
 
@@ -121,6 +222,12 @@ def generate_files(file_count,
 
     @param duplicate_file_ratio: ratio of duplicate files to be generated.
 
+    @param duplicate_method: method used to duplicate a file, one of
+        ``DUPLICATE_METHODS``.
+
+    @param near_duplicate_file_ratio: ratio of files to be generated as
+        a duplicate of another file but its last block.
+
     @param file_extensions: list of allowed file extensions to be used
         when generate files (e.g., ``['gif', 'jpg', 'mp3']``).
 
@@ -143,14 +250,27 @@ def generate_files(file_count,
 
     @param file_min_size: minimum size of a file to randomly generate.
 
+    @param file_size_distribution: distribution of the size of the files
+        to randomly generate, one of ``FILE_SIZE_DISTRIBUTIONS``.
+
     @param root_path: absolute root path where to generate files.
 
+    @param sparse: indicate whether to only write the first and the last
+        blocks of the random files, leaving a hole in between.
+
+    @param jobs: number of processes writing the files in parallel.
+
 
     @return: the list of `(file_path_name, file_size)` of files that have
         been generated.
     """
     file_path_name_sizes = []
-    duplicate_file_path_names = []
+    # Index of the original file of each duplicate file.
+    source_file_indexes = {}
+    # Index of the original file of each near duplicate file.
+    near_source_file_indexes = {}
+    # Path name, size and seed of the content of the original files.
+    random_file_specs = []
 
     for i in range(file_count):
         path = os.path.join(root_path if root_path else '.', generate_random_path(
@@ -168,23 +288,62 @@ def generate_files(file_count,
 
         file_path_name = os.path.join(path, file_name)
 
-        if len(file_path_name_sizes) * duplicate_file_ratio > len(duplicate_file_path_names):
-            duplicate_file(file_path_name_sizes[random.randint(0, len(file_path_name_sizes) - 1)][0], file_path_name)
-            duplicate_file_path_names.append(file_path_name)
+        if len(file_path_name_sizes) * duplicate_file_ratio > len(source_file_indexes):
+            source_file_index = get_random_source_file_index(len(file_path_name_sizes),
+                source_file_indexes, near_source_file_indexes)
+            source_file_indexes[len(file_path_name_sizes)] = source_file_index
+            file_size = file_path_name_sizes[source_file_index][1]
+
+        elif len(file_path_name_sizes) * near_duplicate_file_ratio > len(near_source_file_indexes):
+            source_file_index = get_random_source_file_index(len(file_path_name_sizes),
+                source_file_indexes, near_source_file_indexes)
+            near_source_file_indexes[len(file_path_name_sizes)] = source_file_index
+            file_size = file_path_name_sizes[source_file_index][1]
 
         else:
-            file_size = generate_random_file(file_path_name,
-                file_min_size=file_min_size,
-                file_max_size=file_max_size)
+            assert file_min_size and file_max_size and file_min_size < file_max_size
+            file_size = generate_random_file_size(file_min_size, file_max_size,
+                file_size_distribution=file_size_distribution)
+            random_file_specs.append((file_path_name, file_size, random.getrandbits(64), sparse))
 
         file_path_name_sizes.append((file_path_name, file_size))
 
+    with create_executor(jobs) as executor:
+        map_function = executor.map if executor else map
+        if random_file_specs:
+            list(map_function(write_random_file, *zip(*random_file_specs)))
+
+        for function, file_indexes in ((duplicate_file, source_file_indexes),
+                                       (near_duplicate_file, near_source_file_indexes)):
+            if file_indexes:
+                list(map_function(function, *zip(*[
+                    (file_path_name_sizes[source_file_index][0],
+                     file_path_name_sizes[file_index][0],
+                     duplicate_method)
+                    for file_index, source_file_index in file_indexes.items()])))
+
     return file_path_name_sizes
 
 
+def create_executor(jobs):
+    """
+    Create the pool of processes writing the files.
+
+
+    @param jobs: number of processes.
+
+
+    @return: an instance ``concurrent.futures.ProcessPoolExecutor``, or a
+        null context when the files are written by the current process.
+    """
+    return concurrent.futures.ProcessPoolExecutor(jobs) if jobs > 1 \
+        else contextlib.nullcontext()
+
+
 def generate_random_file(file_path_name,
         file_min_size=FILE_MIN_SIZE,
-        file_max_size=FILE_MAX_SIZE):
+        file_max_size=FILE_MAX_SIZE,
+        file_size_distribution='uniform'):
     """
     Create a binary file of a random size of bytes.
 
@@ -197,34 +356,82 @@ def generate_random_file(file_path_name,
     @param file_max_size: maximum size in bytes of the file to randomly
         generate.
 
+    @param file_size_distribution: distribution of the size of the file
+        to randomly generate, one of ``FILE_SIZE_DISTRIBUTIONS``.
+
 
     @return: the size of the file that has been created.
     """
     # Choose a random size for this file.
     assert file_min_size and file_max_size and file_min_size < file_max_size
-    file_required_size = random.randint(file_min_size, file_max_size)
-    file_current_size = 0
+    file_required_size = generate_random_file_size(file_min_size, file_max_size,
+        file_size_distribution=file_size_distribution)
 
-    # Preferred file system block size.
-    preferred_block_size = os.statvfs('/').f_bsize
-    assert preferred_block_size
+    return write_random_file(file_path_name, file_required_size)
+
+
+def generate_random_file_size(file_min_size, file_max_size,
+        file_size_distribution='uniform'):
+    """
+    Generate a random size of a file.
 
-    # Reduce the size of the block if the chosen size of the file to be
-    # generated is below.
-    block_size = min(file_required_size, preferred_block_size)
 
-    # Create the file with random binary blocks up to the chosen size of
-    # this file.
-    with io.open(file_path_name, mode='wb') as fd:
-        while block_size > 0: # Faster than `file_current_size < file_required_size`
-            fd.write(bytes([random.randint(0, 255) for i in range(block_size)]))
-            file_current_size += block_size
+    @param file_min_size: minimum size in bytes.
 
-            # Resize the block for the last read.
-            if file_current_size + block_size > file_required_size:
-                block_size = file_required_size - file_current_size
+    @param file_max_size: maximum size in bytes.
 
-    return file_required_size
+    @param file_size_distribution: one of ``FILE_SIZE_DISTRIBUTIONS``.
+
+
+    @return: a size in bytes between the minimum and the maximum sizes.
+    """
+    if file_size_distribution == 'uniform':
+        return random.randint(file_min_size, file_max_size)
+
+    # Log-normal distribution centered on the geometric mean of the bounds,
+    # with the bounds three standard deviations away.
+    log_min_size, log_max_size = math.log(file_min_size), math.log(file_max_size)
+    file_size = int(random.lognormvariate((log_min_size + log_max_size) / 2,
+        (log_max_size - log_min_size) / 6))
+    return min(max(file_size, file_min_size), file_max_size)
+
+
+def get_random_source_file_index(file_count, *source_file_indexes):
+    """
+    Choose a random file to duplicate among the files generated so far.
+
+
+    @param file_count: number of files generated so far.
+
+    @param source_file_indexes: dictionaries of the index of the original
+        file of each duplicate and near duplicate file.
+
+
+    @return: the index of the chosen file, or of its original file if
+        the chosen file is a duplicate or a near duplicate, so that all the
+        duplicates can be written once the original files are.
+    """
+    file_index = random.randint(0, file_count - 1)
+    for file_indexes in source_file_indexes:
+        file_index = file_indexes.get(file_index, file_index)
+    return file_index
+
+
+def get_write_block_size(path):
+    """
+    Return the size of the blocks to write to the files of a path.
+
+
+    @param path: a path of the file system where files are written.
+
+
+    @return: the largest multiple of the preferred block size of the file
+        system not above ``WRITE_BLOCK_SIZE``.
+    """
+    preferred_block_size = os.statvfs(path).f_bsize
+    assert preferred_block_size
+
+    return max(WRITE_BLOCK_SIZE // preferred_block_size, 1) * preferred_block_size
 
 
 def generate_random_file_name(
@@ -308,10 +515,15 @@ def main():
     """
     arguments = parse_arguments()
 
+    # The same seed generates the same tree.
+    random.seed(arguments.seed)
+
     print(json.dumps(generate_files(arguments.file_count,
         directory_max_depth=arguments.directory_max_depth,
         directory_min_depth=arguments.directory_min_depth,
         duplicate_file_ratio=arguments.duplicate_file_ratio,
+        duplicate_method=arguments.duplicate_method,
+        near_duplicate_file_ratio=arguments.near_duplicate_file_ratio,
         file_extensions=arguments.file_extensions and arguments.file_extensions.split(','),
         file_extension_max_length=arguments.file_extension_max_length,
         file_extension_min_length=arguments.file_extension_min_length,
@@ -320,7 +532,10 @@ def main():
         file_name_min_length=arguments.file_name_min_length,
         file_min_size=arguments.file_min_size,
         file_max_size=arguments.file_max_size,
-        root_path=arguments.root_path)))
+        file_size_distribution=arguments.file_size_distribution,
+        root_path=arguments.root_path,
+        sparse=arguments.sparse,
+        jobs=arguments.jobs)))
 
 
 def make_directory_if_not_exists(path):
@@ -347,6 +562,41 @@ def make_directory_if_not_exists(path):
             raise error
 
 
+def write_random_file(file_path_name, file_size, seed=None, sparse=False):
+    """
+    Create a binary file of random bytes, written in large blocks.
+
+
+    @param file_path_name: absolute path name of the file to be created.
+
+    @param file_size: size in bytes of the file to be created.
+
+    @param seed: seed of the random bytes, to generate the same content
+        again.  If not defined, the bytes are read from ``os.urandom``.
+
+    @param sparse: indicate whether to only write the first and the last
+        blocks of the file, leaving a hole in between which takes no disk
+        space and reads as zero bytes.
+
+
+    @return: the size of the file that has been created.
+    """
+    generate_random_bytes = os.urandom if seed is None else random.Random(seed).randbytes
+    block_size = get_write_block_size(os.path.dirname(file_path_name) or os.curdir)
+
+    offsets = range(0, file_size, block_size)
+    if sparse:
+        offsets = sorted({offsets[0], offsets[-1]})
+
+    # Unbuffered, each block is written with a single system call.
+    with io.open(file_path_name, mode='wb', buffering=0) as fd:
+        for offset in offsets:
+            fd.seek(offset)
+            fd.write(generate_random_bytes(min(block_size, file_size - offset)))
+
+    return file_size
+
+
 def parse_arguments():
     """
     Convert argument strings to objects and assign them as attributes of
@@ -370,6 +620,13 @@ def parse_arguments():
 
     parser.add_argument('--duplicate-file-ratio', type=float, required=False, default=0.2,
         help='specify the ratio of duplicate files to be generated')
+    parser.add_argument('--duplicate-method', choices=DUPLICATE_METHODS, required=False,
+        default='copy',
+        help='specify how to duplicate a file: copy its bytes, copy them in the kernel '
+             '(copy-file-range), or clone it (reflink) where the file system supports it')
+    parser.add_argument('--near-duplicate-file-ratio', type=float, required=False, default=0.0,
+        help='specify the ratio of files to be generated as a duplicate of another file '
+             'but their last block')
 
     parser.add_argument('--file-extensions', required=False,
         help='specify a comma-separated values of file extension to be used when generate files (e.g., "gif,jpg,mp3")')
@@ -388,6 +645,19 @@ def parse_arguments():
         help='specify the minimum size of a file to randomly generate')
     parser.add_argument('--file-max-size', type=int, required=False, default=FILE_MAX_SIZE,
         help='specify the maximum size of a file to randomly generate')
+    parser.add_argument('--file-size-distribution', choices=FILE_SIZE_DISTRIBUTIONS,
+        required=False, default='uniform',
+        help='specify the distribution of the size of the files to randomly generate')
+
+    parser.add_argument('--sparse', action='store_true',
+        help='specify to only write the first and the last blocks of the files, '
+             'leaving a hole in between')
+
+    parser.add_argument('-j', '--jobs', type=int, required=False, default=1,
+        help='specify the number of processes writing the files in parallel')
+
+    parser.add_argument('--seed', type=int, required=False,
+        help='specify the seed of the random generator, to generate a reproducible tree')
 
     return parser.parse_args()
 
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark of the methods inserting the frags of a match"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import psycopg2
+import constants as const
+import process_log
+
+# Default number of frags of the synthetic match
+FRAG_COUNT = 100000
+
+
+def parse_arguments():
+    """Convert argument strings to objects and assign them as attributes of
+    the namespace.
+
+    Returns: an instance argparse.Namespace corresponding to the populated namespace.
+    """
+    parser = argparse.ArgumentParser(description='Far Cry Frag Inserts Benchmark')
+    parser.add_argument('--frags', type=int, default=FRAG_COUNT,
+                        help='the number of frags of the match (default: %(default)s)')
+    parser.add_argument('--postgresql', metavar='HOST,DATABASE,USER[,PASSWORD]',
+                        help='also benchmark the PostgreSQL methods on this database, '
+                             'whose frags of the benchmark are rolled back')
+    return parser.parse_args()
+
+
+def generate_frags(frag_count, seed=0):
+    """Generate the frags of a synthetic match, one out of ten being a suicide
+
+    Arguments:
+        frag_count: (int) the number of frags
+        seed: the seed of the random generator
+
+    Returns: a list of frags, as returned by parse_frags
+    """
+    generator = random.Random(seed)
+    players = ['player%d' % number for number in range(16)]
+    weapons = sorted(const.WEAPONS_DICT)
+    frag_time = datetime.datetime(2019, 3, 1, tzinfo=datetime.timezone.utc)
+    frags = []
+    for _ in range(frag_count):
+        frag_time += datetime.timedelta(seconds=generator.randint(0, 3))
+        killer = generator.choice(players)
+        if generator.random() < 0.1:
+            frags.append((frag_time, killer))
+        else:
+            frags.append((frag_time, killer, generator.choice(players), generator.choice(weapons)))
+    return frags
+
+
+def benchmark_sqlite(frags):
+    """Insert the frags with each SQLite method into a new database file
+
+    Returns: a dictionary of the seconds taken by each method
+    """
+    seconds = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for insert_method in const.SQLITE_INSERT_METHODS:
+            connection = sqlite3.connect(os.path.join(directory, insert_method + '.db'))
+            connection.executescript(const.SQLITE_CREATE_TABLES)
+            start = time.perf_counter()
+            with connection:
+                process_log.insert_frags_to_sqlite(connection, 1, frags, insert_method)
+            seconds[insert_method] = time.perf_counter() - start
+            connection.close()
+    return seconds
+
+
+def benchmark_postgresql(properties, frags):
+    """Insert the frags with each PostgreSQL method, in transactions which are
+    rolled back
+
+    Returns: a dictionary of the seconds taken by each method
+    """
+    seconds = {}
+    connection = psycopg2.connect(host=properties[0], dbname=properties[1],
+                                  user=properties[2], password=properties[3])
+    try:
+        for insert_method in const.POSTGRES_INSERT_METHODS:
+            with connection.cursor() as cur:
+                cur.execute(const.POSTGRES_MATCH, (frags[0][0], frags[-1][0], 'FFA', 'mp_benchmark'))
+                match_id = cur.fetchone()[0]
+                start = time.perf_counter()
+                process_log.insert_frags_to_postgresql(cur, match_id, frags, insert_method)
+                seconds[insert_method] = time.perf_counter() - start
+            connection.rollback()
+    finally:
+        connection.close()
+    return seconds
+
+
+def main():
+    """Print the throughput of each insert method"""
+    arguments = parse_arguments()
+    frags = generate_frags(arguments.frags)
+
+    results = [('sqlite', benchmark_sqlite(frags))]
+    if arguments.postgresql:
+        properties = (arguments.postgresql.split(',') + [None])[:4]
+        results.append(('postgresql', benchmark_postgresql(properties, frags)))
+
+    for database, seconds in results:
+        for insert_method, duration in seconds.items():
+            print('%-10s %-14s %8.3f s %10.0f frags/s'
+                  % (database, insert_method, duration, len(frags) / duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Benchmark of the parsing of a large Far Cry log, in several passes over
+its whole text or in a single pass over its lines"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import process_log
+
+# Default number of times the game session of the log is repeated
+SCALE = 1000
+
+
+def parse_arguments():
+    """Convert argument strings to objects and assign them as attributes of
+    the namespace.
+
+    Returns: an instance argparse.Namespace corresponding to the populated namespace.
+    """
+    parser = argparse.ArgumentParser(description='Far Cry Log Parsing Benchmark')
+    parser.add_argument('--log', default='./logs/log01.txt',
+                        help='the log to scale up (default: %(default)s)')
+    parser.add_argument('--scale', type=int, default=SCALE,
+                        help='the number of times its game session is repeated '
+                             '(default: %(default)s)')
+    return parser.parse_args()
+
+
+def write_scaled_log(log_file_pathname, scaled_log_file, scale):
+    """Write a log whose lines following the time zone are repeated
+
+    Arguments:
+        log_file_pathname: (str) pathname of a Far Cry server log file
+        scaled_log_file: a file object open for writing
+        scale: (int) the number of times the lines are repeated
+    """
+    with open(log_file_pathname) as log_file:
+        lines = log_file.readlines()
+    header_size = next(index for index, line in enumerate(lines)
+                       if 'Lua cvar: (g_timezone' in line) + 1
+    scaled_log_file.writelines(lines[:header_size])
+    body = ''.join(lines[header_size:])
+    for _ in range(scale):
+        scaled_log_file.write(body)
+
+
+def parse_in_several_passes(log_file_pathname):
+    """Parse a log with a regular expression run over its whole text for
+    each property of the match
+
+    Returns: the list of the frags
+    """
+    log_data = process_log.read_log_file(log_file_pathname)
+    log_start_time = process_log.parse_log_start_time(log_data)
+    process_log.parse_match_game_mode_and_map_name(log_data)
+    frags = process_log.parse_frags(log_data)
+    process_log.parse_match_start_and_end_times(log_data, log_start_time, frags)
+    return frags
+
+
+def parse_frag_offsets(log_file_pathname):
+    """Parse the frags of a log in a single regular expression pass, their
+    times being integer offsets rather than datetime objects
+
+    Returns: the list of the players of the frags
+    """
+    return process_log.parse_frag_offsets(process_log.read_log_file(log_file_pathname))[2]
+
+
+def parse_in_a_single_pass(log_file_pathname):
+    """Parse a log line by line, each line classified and parsed by a
+    single regular expression
+
+    Returns: the list of the frags
+    """
+    return process_log.parse_log_file(log_file_pathname)['frags']
+
+
+def main():
+    """Print the time taken by each way of parsing the scaled log"""
+    arguments = parse_arguments()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.txt') as scaled_log_file:
+        write_scaled_log(arguments.log, scaled_log_file, arguments.scale)
+        scaled_log_file.flush()
+        size = os.path.getsize(scaled_log_file.name) / 1024 / 1024
+
+        for parse in (parse_in_several_passes, parse_frag_offsets, parse_in_a_single_pass):
+            start = time.perf_counter()
+            frags = parse(scaled_log_file.name)
+            duration = time.perf_counter() - start
+            print('%-24s %8.2f s %8.1f MB/s %9d frags'
+                  % (parse.__name__, duration, size / duration, len(frags)))
+
+
+if __name__ == "__main__":
+    main()
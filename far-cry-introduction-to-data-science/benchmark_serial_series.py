@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Benchmark of the computation of serial killers and losers"""
+import argparse
+import logging
+import time
+import process_log
+from benchmark_inserts import generate_frags
+
+# Default number of frags of the largest synthetic log
+FRAG_COUNT = 1000000
+
+
+def parse_arguments():
+    """Convert argument strings to objects and assign them as attributes of
+    the namespace.
+
+    Returns: an instance argparse.Namespace corresponding to the populated namespace.
+    """
+    parser = argparse.ArgumentParser(description='Far Cry Serial Killers Benchmark')
+    parser.add_argument('--frags', type=int, default=FRAG_COUNT,
+                        help='the number of frags of the largest log (default: %(default)s)')
+    return parser.parse_args()
+
+
+def main():
+    """Print the throughput of calculate_serial_killers_and_losers on logs
+    ten times larger each, which stays the same as the time is linear
+    """
+    arguments = parse_arguments()
+    # The longest series of each player are not logged
+    logging.getLogger().setLevel(logging.WARNING)
+
+    frag_count = arguments.frags
+    frag_counts = []
+    while frag_count >= 1000:
+        frag_counts.insert(0, frag_count)
+        frag_count //= 10
+
+    for frag_count in frag_counts:
+        frags = generate_frags(frag_count)
+        start = time.perf_counter()
+        serial_killers, serial_losers = process_log.calculate_serial_killers_and_losers(frags)
+        duration = time.perf_counter() - start
+        print('%9d frags %8.3f s %10.0f frags/s, %d serial killers, %d serial losers'
+              % (frag_count, duration, frag_count / duration,
+                 len(serial_killers), len(serial_losers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Check that the frags parsed with a regular expression run over the whole
+text of a log are the frags parsed line by line, on every log of a directory"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import process_log
+
+
+def parse_arguments():
+    """Convert argument strings to objects and assign them as attributes of
+    the namespace.
+
+    Returns: an instance argparse.Namespace corresponding to the populated namespace.
+    """
+    parser = argparse.ArgumentParser(description='Far Cry Log Parsers Check')
+    parser.add_argument('--logs', default='./logs',
+                        help='the directory of the logs to parse (default: %(default)s)')
+    return parser.parse_args()
+
+
+def parse_frags_both_ways(log_file_pathname):
+    """Parse the frags of a log in a single pass over its lines, and with a
+    regular expression run over its whole text
+
+    Arguments:
+        log_file_pathname: (str) pathname of a Far Cry server log file
+
+    Returns: a tuple (line_frags, text_frags) of the lists of the frags
+    """
+    line_frags = process_log.parse_log_file(log_file_pathname)['frags']
+    text_frags = process_log.parse_frags(process_log.read_log_file(log_file_pathname))
+    return line_frags, text_frags
+
+
+def main():
+    """Print the number of frags of each log, and the frags found by one
+    parser only; exit with status 1 if the parsers disagree on any log"""
+    arguments = parse_arguments()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    mismatch_count = 0
+    for log_file_pathname in sorted(glob.glob(os.path.join(arguments.logs, '*.txt'))):
+        line_frags, text_frags = parse_frags_both_ways(log_file_pathname)
+        if line_frags == text_frags:
+            print('%-24s %6d frags  ok' % (log_file_pathname, len(line_frags)))
+            continue
+
+        mismatch_count += 1
+        print('%-24s %6d frags  MISMATCH (%d over the whole text)'
+              % (log_file_pathname, len(line_frags), len(text_frags)))
+        for frag in line_frags:
+            if frag not in text_frags:
+                print('    only parsed line by line: %s' % (frag,))
+        for frag in text_frags:
+            if frag not in line_frags:
+                print('    only parsed over the text: %s' % (frag,))
+
+    if mismatch_count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
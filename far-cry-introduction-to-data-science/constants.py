@@ -9,6 +9,25 @@ START_GAME_SESSION = re.compile(r"<(.*)>  Level (.*) loaded in (.*) seconds")
 END_TIME_PATTERN = re.compile(r"<(.*)> == Statistics")
 END_TIME_ERROR_PATTERN = re.compile(r"<(.*)> ERROR: \$3#SCRIPT ERROR File: =C, Function: _ERRORMESSAGE,")
 
+# The frag lines of a log, searched over its whole text: the names are not
+# greedy and do not span lines, as in LOG_LINE_PATTERN
+FRAG_LINE_PATTERN = re.compile(
+    r'<(\d\d:\d\d)> <Lua> ([^\n]*?) killed (?:([^\n]*?) with (\w*)|itself)')
+
+# The records of a game session, classified and parsed in a single match: the
+# name of the alternative which matched is the lastgroup of the match, the
+# most frequent records come first. The names are not greedy so that, searched
+# over a line where the server wrote a frag over another one, it finds both
+# frags, as FRAG_LINE_PATTERN does.
+LOG_LINE_PATTERN = re.compile(
+    r'<(?P<time>\d\d:\d\d)> (?:'
+    r'(?P<frag><Lua> (?P<killer_name>.*?) killed '
+    r'(?:(?P<victim_name>.*?) with (?P<weapon_code>\w*)|itself))'
+    r'|(?P<end_time_error>ERROR: \$3#SCRIPT ERROR File: =C, Function: _ERRORMESSAGE,)'
+    r'|(?P<mode_and_map>.*Loading level Levels/(?P<map_name>.*), mission (?P<game_mode>\w+))'
+    r'|(?P<match_start> Level .* loaded in .* seconds)'
+    r'|(?P<end_time>== Statistics))')
+
 # Emojis:
 BLUE_CAR = u"🚙"
 PISTOL = u"🔫"
@@ -47,7 +66,21 @@ WEAPONS_DICT = {
 }
 
 # SQL
-
+SQLITE_CREATE_TABLES = """CREATE TABLE IF NOT EXISTS match (
+    match_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    game_mode TEXT NOT NULL,
+    map_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_frag (
+    match_id INTEGER NOT NULL,
+    frag_time TEXT NOT NULL,
+    killer_name TEXT NOT NULL,
+    victim_name TEXT,
+    weapon_code TEXT,
+    FOREIGN KEY(match_id) REFERENCES match(match_id) ON UPDATE CASCADE ON DELETE RESTRICT
+);"""
 
 SQLITE_MATCH = """INSERT INTO match (start_time, end_time, game_mode, map_name)
                 VALUES (?, ?, ?, ?)"""
@@ -62,4 +95,14 @@ POSTGRES_MATCH = """INSERT INTO match
 POSTGRES_KILL_OTHER = """INSERT INTO match_frag (match_id, frag_time,
     killer_name, victim_name, weapon_code) VALUES(%s, %s, %s, %s, %s)"""
 POSTGRES_KILL_ITSELF = """INSERT INTO match_frag
-    (match_id, frag_time, killer_name) VALUES(%s, %s, %s)"""
\ No newline at end of file
+    (match_id, frag_time, killer_name) VALUES(%s, %s, %s)"""
+
+# Bulk inserts of frags, a suicide having no victim nor weapon (NULL)
+POSTGRES_FRAGS_VALUES = """INSERT INTO match_frag (match_id, frag_time,
+    killer_name, victim_name, weapon_code) VALUES %s"""
+POSTGRES_COPY_FRAGS = """COPY match_frag (match_id, frag_time,
+    killer_name, victim_name, weapon_code) FROM STDIN WITH (FORMAT csv)"""
+
+# Methods to insert the frags of a match
+SQLITE_INSERT_METHODS = ('execute', 'executemany')
+POSTGRES_INSERT_METHODS = ('execute', 'execute_values', 'copy')
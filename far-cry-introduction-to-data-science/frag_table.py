@@ -0,0 +1,277 @@
+"""Columnar store of the frags of many Far Cry matches"""
+import array
+import collections
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Identifier of the victim and of the weapon of a suicide
+NO_ID = -1
+
+
+class FragTable:
+    """The frags of many matches stored as columns: the times as epoch
+    seconds, the players and the weapons as identifiers into lists of their
+    names, and a flag of the suicides. The group-by operations mirror the
+    queries of postgreSQL/farcry_query_postgre.sql, vectorised with numpy
+    if it is installed.
+    """
+    def __init__(self):
+        self.match_keys = []                      # match number -> key of the match
+        self.match_utc_offsets = array.array('l')  # match number -> seconds
+        self.players = []                         # player id -> name
+        self.player_ids = {}
+        self.weapons = []                         # weapon id -> code
+        self.weapon_ids = {}
+
+        self.match_numbers = array.array('l')     # frag -> match number
+        self.times = array.array('q')             # frag -> epoch seconds
+        self.killer_ids = array.array('l')
+        self.victim_ids = array.array('l')        # NO_ID for a suicide
+        self.weapon_ids_column = array.array('l')  # NO_ID for a suicide
+        self.suicides = array.array('b')
+
+    def __len__(self):
+        return len(self.times)
+
+    def _get_player_id(self, player_name):
+        player_id = self.player_ids.get(player_name)
+        if player_id is None:
+            player_id = self.player_ids[player_name] = len(self.players)
+            self.players.append(player_name)
+        return player_id
+
+    def _get_weapon_id(self, weapon_code):
+        weapon_id = self.weapon_ids.get(weapon_code)
+        if weapon_id is None:
+            weapon_id = self.weapon_ids[weapon_code] = len(self.weapons)
+            self.weapons.append(weapon_code)
+        return weapon_id
+
+    def add_match(self, frags, match_key=None):
+        """Append the frags of a match to the columns
+
+        Arguments:
+            frags: (list) a list of frags, as returned by parse_frags
+            match_key: the key of the match in the results of the group-by
+                operations, such as its log file pathname; its number if None
+
+        Returns: the number of the match in the table
+        """
+        match_number = len(self.match_keys)
+        self.match_keys.append(match_number if match_key is None else match_key)
+        utc_offset = frags[0][0].utcoffset() if frags else None
+        self.match_utc_offsets.append(int(utc_offset.total_seconds()) if utc_offset else 0)
+
+        for frag in frags:
+            self.match_numbers.append(match_number)
+            self.times.append(int(frag[0].timestamp()))
+            self.killer_ids.append(self._get_player_id(frag[1]))
+            if len(frag) == 2:
+                self.victim_ids.append(NO_ID)
+                self.weapon_ids_column.append(NO_ID)
+                self.suicides.append(1)
+            else:
+                self.victim_ids.append(self._get_player_id(frag[2]))
+                self.weapon_ids_column.append(self._get_weapon_id(frag[3]))
+                self.suicides.append(0)
+        return match_number
+
+    @classmethod
+    def from_matches(cls, matches):
+        """Create a table of matches
+
+        Arguments:
+            matches: (iterable) tuples (match_key, frags)
+
+        Returns: a FragTable
+        """
+        frag_table = cls()
+        for match_key, frags in matches:
+            frag_table.add_match(frags, match_key)
+        return frag_table
+
+    def get_frag(self, index):
+        """Returns: the frag at an index, as returned by parse_frags"""
+        utc_offset = self.match_utc_offsets[self.match_numbers[index]]
+        frag_time = datetime.datetime.fromtimestamp(
+            self.times[index], datetime.timezone(datetime.timedelta(seconds=utc_offset)))
+        killer_name = self.players[self.killer_ids[index]]
+        if self.suicides[index]:
+            return frag_time, killer_name
+        return (frag_time, killer_name, self.players[self.victim_ids[index]],
+                self.weapons[self.weapon_ids_column[index]])
+
+    def count(self, *columns, kills_only=True):
+        """Group the frags by the values of some columns and count them
+
+        Arguments:
+            columns: arrays of identifiers, such as self.match_numbers
+                and self.killer_ids
+            kills_only: (bool) the suicides are not counted
+
+        Returns: a dictionary of the number of frags of each tuple of values
+        """
+        if numpy is not None and len(self):
+            values = [numpy.frombuffer(column, dtype=column.typecode).astype(numpy.int64)
+                      for column in columns]
+            if kills_only:
+                kills = numpy.frombuffer(self.suicides, dtype=numpy.int8) == 0
+                values = [column[kills] for column in values]
+            # Combine the columns into a single key, each one shifted by one
+            # so that NO_ID is not negative
+            radixes = [int(column.max()) + 2 if len(column) else 1 for column in values]
+            keys = numpy.zeros(len(values[0]), dtype=numpy.int64)
+            for column, radix in zip(values, radixes):
+                keys = keys * radix + column + 1
+            unique_keys, counts = numpy.unique(keys, return_counts=True)
+
+            decoded_columns = []
+            for radix in reversed(radixes):
+                decoded_columns.insert(0, (unique_keys % radix - 1).tolist())
+                unique_keys = unique_keys // radix
+            return dict(zip(zip(*decoded_columns), counts.tolist()))
+
+        if kills_only:
+            return collections.Counter(
+                key for key, suicide in zip(zip(*columns), self.suicides) if not suicide)
+        return collections.Counter(zip(*columns))
+
+    def get_kill_counts(self):
+        """Count the kills of each player, suicides excepted
+
+        Returns: a list of tuples (match_key, killer_name, kill_count) ordered
+            by match and by decreasing number of kills
+        """
+        counts = self.count(self.match_numbers, self.killer_ids)
+        return self._get_rows(counts.items())
+
+    def get_most_versatile_killers(self):
+        """Determine the Most Versatile Killer (Waypoint 49): count the
+        distinct weapons used by each player to kill
+
+        Returns: a list of tuples (match_key, killer_name, weapon_count)
+            ordered by match and by decreasing number of weapons
+        """
+        weapon_counts = collections.Counter(
+            (match_number, killer_id) for match_number, killer_id, _
+            in self.count(self.match_numbers, self.killer_ids, self.weapon_ids_column))
+        return self._get_rows(weapon_counts.items())
+
+    def get_favorite_victims(self):
+        """Determine Players Favorite Victim (Waypoint 50)
+
+        Returns: a list of tuples (match_key, player_name,
+            favorite_victim_name, kill_count) ordered by match and by
+            decreasing number of kills
+        """
+        counts = self.count(self.match_numbers, self.killer_ids, self.victim_ids)
+        return self._get_top_rows(counts.items())
+
+    def get_worst_enemies(self):
+        """Determine Players Worst Enemy (Waypoint 51)
+
+        Returns: a list of tuples (match_key, player_name, worst_enemy_name,
+            kill_count) ordered by match and by decreasing number of kills
+        """
+        counts = self.count(self.match_numbers, self.victim_ids, self.killer_ids)
+        return self._get_top_rows(counts.items())
+
+    def get_kill_streaks(self):
+        """Determine the longest kill streak of each player: the number of
+        other players he killed before being killed, by another player or
+        by himself, or until the end of the match
+
+        Returns: a list of tuples (match_key, player_name, kill_count)
+            ordered by match and by decreasing number of kills
+        """
+        if numpy is not None and len(self):
+            return self._get_rows(self._get_longest_streaks().items())
+
+        longest_streaks = {}
+        streaks = {}
+        current_match_number = None
+        for match_number, killer_id, victim_id, suicide in zip(
+                self.match_numbers, self.killer_ids, self.victim_ids, self.suicides):
+            if match_number != current_match_number:
+                streaks.clear()
+                current_match_number = match_number
+            if suicide or killer_id == victim_id:
+                streaks[killer_id] = 0
+                continue
+            streak = streaks[killer_id] = streaks.get(killer_id, 0) + 1
+            key = (match_number, killer_id)
+            if streak > longest_streaks.get(key, 0):
+                longest_streaks[key] = streak
+            streaks[victim_id] = 0
+        return self._get_rows(longest_streaks.items())
+
+    def _get_longest_streaks(self):
+        # The kills of each player (1) and the ends of his streaks (0),
+        # sorted by match, player and frag
+        match_numbers = numpy.frombuffer(self.match_numbers, dtype=self.match_numbers.typecode) \
+            .astype(numpy.int64)
+        killer_ids = numpy.frombuffer(self.killer_ids, dtype=self.killer_ids.typecode)
+        victim_ids = numpy.frombuffer(self.victim_ids, dtype=self.victim_ids.typecode)
+        # A player killing himself ends his streak, like a suicide
+        suicides = (numpy.frombuffer(self.suicides, dtype=numpy.int8) != 0) \
+            | (killer_ids == victim_ids)
+        kills = ~suicides
+        frag_indexes = numpy.arange(len(self))
+        kill_count, suicide_count = int(kills.sum()), int(suicides.sum())
+
+        event_match_numbers = numpy.concatenate(
+            (match_numbers[kills], match_numbers[kills], match_numbers[suicides]))
+        event_player_ids = numpy.concatenate(
+            (killer_ids[kills], victim_ids[kills], killer_ids[suicides]))
+        event_frag_indexes = numpy.concatenate(
+            (frag_indexes[kills], frag_indexes[kills], frag_indexes[suicides]))
+        increments = numpy.concatenate((numpy.ones(kill_count, dtype=numpy.int64),
+                                        numpy.zeros(kill_count + suicide_count, dtype=numpy.int64)))
+        # A single key is sorted much faster than several ones
+        order = numpy.argsort((event_match_numbers * (len(self.players) + 1) + event_player_ids)
+                              * len(self) + event_frag_indexes)
+        event_match_numbers = event_match_numbers[order]
+        event_player_ids = event_player_ids[order]
+        increments = increments[order]
+
+        # A streak counts the kills since the first event of the player in
+        # the match, or since the end of his previous streak
+        kill_totals = numpy.cumsum(increments)
+        group_starts = numpy.ones(len(increments), dtype=bool)
+        group_starts[1:] = (event_player_ids[1:] != event_player_ids[:-1]) \
+            | (event_match_numbers[1:] != event_match_numbers[:-1])
+        streak_starts = numpy.where(group_starts, kill_totals - increments,
+                                    numpy.where(increments == 0, kill_totals, 0))
+        streaks = kill_totals - numpy.maximum.accumulate(streak_starts)
+
+        group_indexes = numpy.flatnonzero(group_starts)
+        longest_streaks = numpy.maximum.reduceat(streaks, group_indexes)
+        return {(match_number, player_id): longest_streak
+                for match_number, player_id, longest_streak
+                in zip(event_match_numbers[group_indexes].tolist(),
+                       event_player_ids[group_indexes].tolist(), longest_streaks.tolist())
+                if longest_streak}
+
+    def _get_rows(self, counts):
+        # Ordered by match and by decreasing count, then by player id
+        return [(self.match_keys[match_number], self.players[player_id], count)
+                for (match_number, player_id), count
+                in sorted(counts, key=lambda item: (item[0][0], -item[1], item[0][1]))]
+
+    def _get_top_rows(self, counts):
+        # The other player of the highest count of each player, the first
+        # one met in the table in case of a tie
+        top_counts = {}
+        for (match_number, player_id, other_player_id), count in counts:
+            top_count = top_counts.get((match_number, player_id))
+            if top_count is None or (-count, other_player_id) < (-top_count[1], top_count[0]):
+                top_counts[match_number, player_id] = (other_player_id, count)
+        return [(self.match_keys[match_number], self.players[player_id],
+                 self.players[other_player_id], count)
+                for (match_number, player_id), (other_player_id, count)
+                in sorted(top_counts.items(),
+                          key=lambda item: (item[0][0], -item[1][1], item[0][1]))]
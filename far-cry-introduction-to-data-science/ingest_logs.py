@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Ingest many Far Cry logs into a database"""
+import argparse
+import functools
+import glob
+import logging
+import multiprocessing
+import os
+import time
+import constants as const
+import match_export
+import match_repository
+import process_log
+
+# Default number of matches inserted in one transaction
+BATCH_SIZE = 100
+
+
+def parse_arguments():
+    """Convert argument strings to objects and assign them as attributes of
+    the namespace.
+
+    Returns: an instance argparse.Namespace corresponding to the populated namespace.
+    """
+    parser = argparse.ArgumentParser(description='Far Cry Logs Ingestion')
+    parser.add_argument('paths', metavar='PATH', nargs='+',
+                        help='a log file, a directory of log files (*.txt) or a glob '
+                             'pattern such as "logs/2019-*/*.txt"')
+    parser.add_argument('--sqlite', metavar='FILE',
+                        help='the SQLite database to write to, its tables are created '
+                             'if needed')
+    parser.add_argument('--postgresql', metavar='HOST,DATABASE,USER[,PASSWORD]',
+                        help='the PostgreSQL database to write to')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='the number of processes parsing logs (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='the number of matches written in one transaction '
+                             '(default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=match_repository.POOL_SIZE,
+                        help='the maximum number of open connections to the database '
+                             '(default: %(default)s)')
+    parser.add_argument('--insert-method',
+                        choices=sorted(set(const.SQLITE_INSERT_METHODS + const.POSTGRES_INSERT_METHODS)),
+                        help='how the frags of a match are inserted (default: executemany '
+                             'with SQLite, execute_values with PostgreSQL)')
+    parser.add_argument('--export', metavar='DATASET',
+                        help='the directory of a dataset to append the matches and frags '
+                             'to, partitioned by date and map')
+    parser.add_argument('--export-format', choices=match_export.EXPORT_FORMATS,
+                        default=match_export.DEFAULT_EXPORT_FORMAT,
+                        help='the format of the files of the dataset, binary being a '
+                             'compact format which does not require pyarrow '
+                             '(default: %(default)s)')
+
+    arguments = parser.parse_args()
+    if arguments.sqlite and arguments.postgresql:
+        parser.error('at most one of --sqlite and --postgresql is allowed')
+    if not (arguments.sqlite or arguments.postgresql or arguments.export):
+        parser.error('one of --sqlite, --postgresql and --export is required')
+    insert_methods = const.SQLITE_INSERT_METHODS if arguments.sqlite \
+        else const.POSTGRES_INSERT_METHODS
+    if arguments.insert_method and arguments.insert_method not in insert_methods:
+        parser.error('--insert-method must be one of %s with this database'
+                     % ', '.join(insert_methods))
+    if arguments.export_format != 'binary' and match_export.pyarrow is None:
+        parser.error('pyarrow is required to export to %s' % arguments.export_format)
+    return arguments
+
+
+def find_log_files(paths):
+    """Find the log files to ingest
+
+    Arguments:
+        paths: (list) log files, directories of log files or glob patterns
+
+    Returns: a sorted list of the pathnames of the log files, without duplicates
+    """
+    log_file_pathnames = set()
+    for path in paths:
+        if os.path.isdir(path):
+            log_file_pathnames.update(glob.glob(os.path.join(path, '*.txt')))
+        else:
+            log_file_pathnames.update(glob.glob(path))
+    return sorted(log_file_pathnames)
+
+
+def parse_log_file(log_file_pathname):
+    """Parse a log file in a worker process
+
+    Arguments: (str): pathname of a Far Cry server log file
+
+    Returns: a tuple (log_file_pathname, size, match), match being the
+        dictionary returned by process_log.parse_log_file, or None if the log
+        is not a complete match
+    """
+    size = os.path.getsize(log_file_pathname)
+    try:
+        match = process_log.parse_log_file(log_file_pathname)
+    except (OSError, UnicodeDecodeError, ValueError) as error:
+        logging.warning("Unable to parse %s: %s", log_file_pathname, error)
+        return log_file_pathname, size, None
+
+    if not (match['game_mode'] and match['start_time'] and match['end_time']):
+        logging.warning("%s is not a complete match", log_file_pathname)
+        return log_file_pathname, size, None
+    return log_file_pathname, size, match
+
+
+def connect(arguments):
+    """Connect to the database given on the command line
+
+    Returns: a match_repository.MatchRepository
+    """
+    if arguments.sqlite:
+        repository = match_repository.MatchRepository.sqlite(
+            arguments.sqlite, process_log.insert_matches_to_sqlite, arguments.pool_size)
+        with repository.connection() as connection:
+            connection.executescript(const.SQLITE_CREATE_TABLES)
+        return repository
+
+    properties = (arguments.postgresql.split(',') + [None])[:4]
+    return process_log.get_postgresql_repository(properties, arguments.pool_size)
+
+
+def ingest_logs(log_file_pathnames, insert_matches, jobs=1, batch_size=BATCH_SIZE):
+    """Parse logs in parallel and write their matches from this process only,
+    in batches
+
+    Arguments:
+        log_file_pathnames: (list) pathnames of the log files
+        insert_matches: a function inserting a list of matches, such as the
+            method insert_matches of a match_repository.MatchRepository
+        jobs: (int) the number of processes parsing logs
+        batch_size: (int) the number of matches written in one transaction
+
+    Returns: a dictionary of the counts of logs, matches, frags and bytes ingested
+    """
+    stats = {'logs': 0, 'matches': 0, 'frags': 0, 'bytes': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+    batch = []
+
+    def write_batch():
+        insert_matches(batch)
+        stats['matches'] += len(batch)
+        stats['frags'] += sum(len(match['frags']) for match in batch)
+        stats['seconds'] = time.perf_counter() - start
+        logging.info("%d/%d logs, %d matches, %d frags: %.1f logs/s, %.0f frags/s, %.2f MB/s",
+                     stats['logs'], len(log_file_pathnames), stats['matches'], stats['frags'],
+                     stats['logs'] / stats['seconds'], stats['frags'] / stats['seconds'],
+                     stats['bytes'] / 1024 / 1024 / stats['seconds'])
+        batch.clear()
+
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        # Matches are written as soon as they are parsed, in any order
+        results = pool.imap_unordered(parse_log_file, log_file_pathnames,
+                                      chunksize=max(1, len(log_file_pathnames) // (jobs * 8))) \
+            if pool else map(parse_log_file, log_file_pathnames)
+        for _, size, match in results:
+            stats['logs'] += 1
+            stats['bytes'] += size
+            if match:
+                batch.append(match)
+            if len(batch) >= batch_size:
+                write_batch()
+        if batch:
+            write_batch()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    """Ingest the logs given on the command line"""
+    arguments = parse_arguments()
+    log_file_pathnames = find_log_files(arguments.paths)
+    repository = connect(arguments) if arguments.sqlite or arguments.postgresql else None
+
+    # Each batch is written to the database and appended to the dataset
+    write_functions = []
+    if repository:
+        insert_matches = repository.insert_matches
+        if arguments.insert_method:
+            insert_matches = functools.partial(insert_matches,
+                                               insert_method=arguments.insert_method)
+        write_functions.append(insert_matches)
+    if arguments.export:
+        write_functions.append(functools.partial(match_export.export_matches,
+                                                 dataset_path=arguments.export,
+                                                 export_format=arguments.export_format))
+
+    def write_matches(matches):
+        for write_function in write_functions:
+            write_function(matches)
+
+    try:
+        stats = ingest_logs(log_file_pathnames, write_matches,
+                            arguments.jobs, arguments.batch_size)
+    finally:
+        if repository:
+            repository.close()
+    logging.info("Ingested %d matches and %d frags of %d logs in %.2f seconds",
+                 stats['matches'], stats['frags'], stats['logs'], stats['seconds'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Export of parsed Far Cry matches to a columnar dataset"""
+import array
+import json
+import os
+import struct
+import sys
+import urllib.parse
+import uuid
+from frag_table import FragTable, NO_ID
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Formats of the files of a dataset, and their extensions
+EXPORT_FORMATS = ('parquet', 'arrow', 'binary')
+FILE_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow', 'binary': '.fcb'}
+
+# Default format: the compact binary format if pyarrow is not installed
+DEFAULT_EXPORT_FORMAT = 'parquet' if pyarrow else 'binary'
+
+# First bytes of a file of the compact binary format
+BINARY_MAGIC = b'FCCOLS1\n'
+
+
+def get_partition_path(match):
+    """Get the partition of a match, by date and map, as Hive does
+
+    Arguments:
+        match: (dict) a dictionary returned by parse_log_lines
+
+    Returns: (str) the relative path of the partition, such as
+        'date=2019-03-01/map=mp_surf'
+    """
+    start_time = match['start_time'] or match['log_start_time']
+    return os.path.join('date=%s' % start_time.date().isoformat(),
+                        'map=%s' % urllib.parse.quote(match['map_name'] or '', safe=''))
+
+
+def encode_strings(values):
+    """Dictionary-encode a column of strings
+
+    Arguments:
+        values: (iterable) strings, or None
+
+    Returns: a tuple (codes, dictionary) of an array of the index of each
+        value in the dictionary, NO_ID for None, and of the list of the
+        distinct values
+    """
+    codes = array.array('q')
+    dictionary = []
+    indexes = {}
+    for value in values:
+        if value is None:
+            codes.append(NO_ID)
+            continue
+        index = indexes.get(value)
+        if index is None:
+            index = indexes[value] = len(dictionary)
+            dictionary.append(value)
+        codes.append(index)
+    return codes, dictionary
+
+
+def get_match_columns(match_ids, matches):
+    """Build the columns of the table match of a batch of matches
+
+    Arguments:
+        match_ids: (list) the identifiers of the matches
+        matches: (list) dictionaries returned by parse_log_lines, of
+            complete matches
+
+    Returns: a list of tuples (name, kind, values, dictionary), kind being
+        'timestamp' (epoch seconds), 'int' or 'dictionary' (codes of the
+        values in the dictionary)
+    """
+    start_times = array.array('q', [int(match['start_time'].timestamp()) for match in matches])
+    end_times = array.array('q', [int(match['end_time'].timestamp()) for match in matches])
+    utc_offsets = array.array('q', [int(match['start_time'].utcoffset().total_seconds())
+                                    for match in matches])
+    return [('match_id', 'dictionary', *encode_strings(match_ids)),
+            ('start_time', 'timestamp', start_times, None),
+            ('end_time', 'timestamp', end_times, None),
+            ('utc_offset', 'int', utc_offsets, None),
+            ('game_mode', 'dictionary', *encode_strings(match['game_mode'] for match in matches)),
+            ('map_name', 'dictionary', *encode_strings(match['map_name'] for match in matches))]
+
+
+def get_frag_columns(match_ids, matches):
+    """Build the columns of the table match_frag of a batch of matches
+
+    Arguments: the arguments of get_match_columns
+
+    Returns: a list of tuples (name, kind, values, dictionary), as
+        get_match_columns
+    """
+    frag_table = FragTable.from_matches(
+        (match_id, match['frags']) for match_id, match in zip(match_ids, matches))
+    return [('match_id', 'dictionary', array.array('q', frag_table.match_numbers),
+             frag_table.match_keys),
+            ('frag_time', 'timestamp', frag_table.times, None),
+            ('killer_name', 'dictionary', array.array('q', frag_table.killer_ids),
+             frag_table.players),
+            ('victim_name', 'dictionary', array.array('q', frag_table.victim_ids),
+             frag_table.players),
+            ('weapon_code', 'dictionary', array.array('q', frag_table.weapon_ids_column),
+             frag_table.weapons)]
+
+
+def __to_arrow_array(kind, values, dictionary):
+    """Convert a column to an Arrow array without copying its values"""
+    if kind == 'timestamp':
+        return pyarrow.Array.from_buffers(pyarrow.timestamp('s', tz='UTC'), len(values),
+                                          [None, pyarrow.py_buffer(values)])
+    integers = pyarrow.Array.from_buffers(pyarrow.int64(), len(values),
+                                          [None, pyarrow.py_buffer(values)])
+    if kind == 'int':
+        return integers
+    indices = pyarrow.compute.if_else(pyarrow.compute.equal(integers, NO_ID),
+                                      pyarrow.scalar(None, pyarrow.int64()), integers)
+    return pyarrow.DictionaryArray.from_arrays(indices.cast(pyarrow.int32()),
+                                               pyarrow.array(dictionary, pyarrow.string()))
+
+
+def write_arrow_columns(file_path_name, columns, export_format):
+    """Write columns to a Parquet or Arrow IPC file
+
+    Arguments:
+        file_path_name: (str) pathname of the file
+        columns: (list) tuples (name, kind, values, dictionary)
+        export_format: (str) 'parquet' or 'arrow'
+    """
+    table = pyarrow.table({name: __to_arrow_array(kind, values, dictionary)
+                           for name, kind, values, dictionary in columns})
+    if export_format == 'parquet':
+        pyarrow.parquet.write_table(table, file_path_name)
+        return
+    with pyarrow.OSFile(file_path_name, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def write_binary_columns(file_path_name, columns):
+    """Write columns to a file of the compact binary format: BINARY_MAGIC,
+    the length of a JSON header on 4 bytes (little endian), the header,
+    then the bytes of the array of each column
+
+    Arguments:
+        file_path_name: (str) pathname of the file
+        columns: (list) tuples (name, kind, values, dictionary)
+    """
+    header = {'rows': len(columns[0][2]) if columns else 0, 'byteorder': sys.byteorder,
+              'columns': [{'name': name, 'kind': kind, 'typecode': values.typecode,
+                           'dictionary': dictionary}
+                          for name, kind, values, dictionary in columns]}
+    header_bytes = json.dumps(header).encode()
+    with open(file_path_name, 'wb') as binary_file:
+        binary_file.write(BINARY_MAGIC)
+        binary_file.write(struct.pack('<I', len(header_bytes)))
+        binary_file.write(header_bytes)
+        for _, _, values, _ in columns:
+            values.tofile(binary_file)
+
+
+def read_binary_columns(file_path_name):
+    """Read the columns of a file of the compact binary format
+
+    Arguments:
+        file_path_name: (str) pathname of the file
+
+    Returns: a dictionary of the values of each column: arrays of epoch
+        seconds or integers, and lists of strings (None for null)
+    """
+    with open(file_path_name, 'rb') as binary_file:
+        if binary_file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError("%s is not a file of matches" % file_path_name)
+        header_size, = struct.unpack('<I', binary_file.read(4))
+        header = json.loads(binary_file.read(header_size))
+
+        columns = {}
+        for column in header['columns']:
+            values = array.array(column['typecode'])
+            values.fromfile(binary_file, header['rows'])
+            if header['byteorder'] != sys.byteorder:
+                values.byteswap()
+            if column['kind'] == 'dictionary':
+                dictionary = column['dictionary']
+                values = [dictionary[code] if code != NO_ID else None for code in values]
+            columns[column['name']] = values
+    return columns
+
+
+def read_binary_dataset(dataset_path, table_name):
+    """Read a table of a dataset written in the compact binary format, with
+    the columns of its partitions, as pyarrow.dataset reads the other formats
+
+    Arguments:
+        dataset_path: (str) the root directory of the dataset
+        table_name: (str) 'match' or 'match_frag'
+
+    Returns: a dictionary of the list of the values of each column
+    """
+    columns = {}
+    for dir_path, dir_names, file_names in os.walk(os.path.join(dataset_path, table_name)):
+        dir_names.sort()
+        partition = dict(urllib.parse.unquote(dir_name).split('=', 1)
+                         for dir_name in os.path.relpath(dir_path, dataset_path).split(os.sep)
+                         if '=' in dir_name)
+        for file_name in sorted(file_names):
+            if not file_name.endswith(FILE_EXTENSIONS['binary']):
+                continue
+            file_columns = read_binary_columns(os.path.join(dir_path, file_name))
+            row_count = len(next(iter(file_columns.values()), ()))
+            file_columns.update({name: [value] * row_count for name, value in partition.items()})
+            for name, values in file_columns.items():
+                columns.setdefault(name, []).extend(values)
+    return columns
+
+
+def export_matches(matches, dataset_path, export_format=DEFAULT_EXPORT_FORMAT):
+    """Append a batch of matches to a dataset partitioned by date and map:
+    each table gets a new file in the partition of each match, written
+    column by column
+
+    Arguments:
+        matches: (list) dictionaries returned by parse_log_lines, of
+            complete matches
+        dataset_path: (str) the root directory of the dataset
+        export_format: (str) one of EXPORT_FORMATS
+
+    Returns: a list of the identifiers given to the matches
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format %s" % export_format)
+    if export_format != 'binary' and pyarrow is None:
+        raise ValueError("pyarrow is required to export to %s" % export_format)
+
+    match_ids = [uuid.uuid4().hex for _ in matches]
+    partitions = {}
+    for match_id, match in zip(match_ids, matches):
+        partition = partitions.setdefault(get_partition_path(match), ([], []))
+        partition[0].append(match_id)
+        partition[1].append(match)
+
+    file_name = 'part-%s%s' % (uuid.uuid4().hex, FILE_EXTENSIONS[export_format])
+    for partition_path, (partition_match_ids, partition_matches) in partitions.items():
+        for table_name, get_columns in (('match', get_match_columns),
+                                        ('match_frag', get_frag_columns)):
+            dir_path = os.path.join(dataset_path, table_name, partition_path)
+            os.makedirs(dir_path, exist_ok=True)
+            columns = get_columns(partition_match_ids, partition_matches)
+            if export_format == 'binary':
+                write_binary_columns(os.path.join(dir_path, file_name), columns)
+            else:
+                write_arrow_columns(os.path.join(dir_path, file_name), columns, export_format)
+    return match_ids
@@ -0,0 +1,242 @@
+"""Pooled connections to the Far Cry database"""
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+import psycopg2
+import psycopg2.pool
+
+# Default maximum number of open connections of a pool
+POOL_SIZE = 4
+
+# A connection idle for longer than this number of seconds is checked
+# before being used again
+HEALTH_CHECK_INTERVAL = 30.0
+
+HEALTH_CHECK_QUERY = 'SELECT 1'
+
+
+def is_closed(connection):
+    """Returns: True if a psycopg2 or SQLite connection is closed"""
+    if hasattr(connection, 'closed'):
+        return bool(connection.closed)
+    try:
+        connection.total_changes
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+class SQLiteConnectionPool:
+    """A pool of connections to a SQLite database, with the interface of
+    psycopg2.pool.ThreadedConnectionPool, to stand in for PostgreSQL
+    """
+    def __init__(self, minconn, maxconn, database):
+        """
+        Arguments:
+            minconn: (int) the number of connections opened at once, and
+                the maximum number of idle connections kept open
+            maxconn: (int) the maximum number of open connections
+            database: (str) the path of the database file
+        """
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.database = database
+        self.closed = False
+        self._idle_connections = queue.LifoQueue()
+        self._used_connections = set()
+        self._lock = threading.Lock()
+        for _ in range(minconn):
+            self._idle_connections.put(self._connect())
+
+    def _connect(self):
+        # Connections move from thread to thread through the pool
+        return sqlite3.connect(self.database, check_same_thread=False)
+
+    def getconn(self):
+        """Returns: an idle connection, or a new one if the pool is not full"""
+        with self._lock:
+            if self.closed:
+                raise psycopg2.pool.PoolError("connection pool is closed")
+            try:
+                connection = self._idle_connections.get_nowait()
+            except queue.Empty:
+                if len(self._used_connections) >= self.maxconn:
+                    raise psycopg2.pool.PoolError("connection pool exhausted")
+                connection = self._connect()
+            self._used_connections.add(connection)
+            return connection
+
+    def putconn(self, connection, close=False):
+        """Give a connection back to the pool, or close it if minconn
+        connections are already idle, as psycopg2 does"""
+        with self._lock:
+            self._used_connections.discard(connection)
+            if close or self.closed or self._idle_connections.qsize() >= self.minconn:
+                connection.close()
+            else:
+                self._idle_connections.put(connection)
+
+    def closeall(self):
+        """Close all the connections of the pool"""
+        with self._lock:
+            self.closed = True
+            while not self._idle_connections.empty():
+                self._idle_connections.get_nowait().close()
+            for connection in self._used_connections:
+                connection.close()
+            self._used_connections.clear()
+
+
+class MatchRepository:
+    """The matches of a database, inserted through a pool of connections
+    which are checked before being used again
+    """
+    def __init__(self, pool, insert_matches, health_check_interval=HEALTH_CHECK_INTERVAL):
+        """
+        Arguments:
+            pool: a psycopg2.pool.ThreadedConnectionPool or a SQLiteConnectionPool
+            insert_matches: a function inserting a list of matches with a
+                connection, such as process_log.insert_matches_to_postgresql
+            health_check_interval: (float) the number of seconds a connection
+                stays idle before it is checked
+        """
+        self.pool = pool
+        self.insert_matches_function = insert_matches
+        self.health_check_interval = health_check_interval
+        self._last_used_times = {}
+        self._lock = threading.Lock()
+        # Threads wait for a connection rather than exhaust the pool
+        self._available_connections = threading.BoundedSemaphore(pool.maxconn)
+
+    @classmethod
+    def postgresql(cls, properties, insert_matches, pool_size=POOL_SIZE, **kwargs):
+        """Create a repository of a PostgreSQL database
+
+        Arguments:
+            properties: (tuple) form: (hostname, database_name, username, password)
+            insert_matches: a function inserting a list of matches with a connection
+            pool_size: (int) the maximum number of open connections
+
+        Returns: a MatchRepository
+        """
+        # The pool closes the connections given back beyond minconn idle ones
+        pool = psycopg2.pool.ThreadedConnectionPool(
+            pool_size, pool_size, host=properties[0], dbname=properties[1],
+            user=properties[2], password=properties[3])
+        return cls(pool, insert_matches, **kwargs)
+
+    @classmethod
+    def sqlite(cls, database, insert_matches, pool_size=POOL_SIZE, **kwargs):
+        """Create a repository of a SQLite database
+
+        Arguments:
+            database: (str) the path of the database file
+            insert_matches: a function inserting a list of matches with a connection
+            pool_size: (int) the maximum number of open connections
+
+        Returns: a MatchRepository
+        """
+        return cls(SQLiteConnectionPool(pool_size, pool_size, database), insert_matches,
+                   **kwargs)
+
+    def is_healthy(self, connection):
+        """Check a connection with a trivial query
+
+        Returns: True if the connection can be used
+        """
+        if is_closed(connection):
+            return False
+        try:
+            cur = connection.cursor()
+            try:
+                cur.execute(HEALTH_CHECK_QUERY)
+                cur.fetchall()
+            finally:
+                cur.close()
+            # End the transaction opened by psycopg2
+            connection.rollback()
+        except (psycopg2.Error, sqlite3.Error):
+            return False
+        return True
+
+    def get_connection(self):
+        """Take a connection from the pool, waiting for one if they are all
+        used, and replacing the broken ones
+
+        Returns: an open connection, to give back with put_connection
+        """
+        self._available_connections.acquire()
+        try:
+            # A pool holds at most its size of broken connections
+            for _ in range(self.pool.maxconn + 1):
+                connection = self.pool.getconn()
+                # Only the idle connections have a time: an id can be reused
+                # by a new connection once the pool closed the previous one
+                with self._lock:
+                    last_used_time = self._last_used_times.pop(id(connection), None)
+                if last_used_time is None \
+                        or time.monotonic() - last_used_time < self.health_check_interval \
+                        or self.is_healthy(connection):
+                    return connection
+                self._discard_connection(connection)
+            raise psycopg2.pool.PoolError("no healthy connection")
+        except BaseException:
+            self._available_connections.release()
+            raise
+
+    def _discard_connection(self, connection):
+        with self._lock:
+            self._last_used_times.pop(id(connection), None)
+        self.pool.putconn(connection, close=True)
+
+    def put_connection(self, connection, close=False):
+        """Give a connection back to the pool, or close it"""
+        try:
+            if close:
+                self._discard_connection(connection)
+            else:
+                with self._lock:
+                    self._last_used_times[id(connection)] = time.monotonic()
+                self.pool.putconn(connection)
+                if is_closed(connection):
+                    with self._lock:
+                        self._last_used_times.pop(id(connection), None)
+        finally:
+            self._available_connections.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Use a connection of the pool in a with statement; it is closed
+        rather than given back if the database failed
+        """
+        connection = self.get_connection()
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.put_connection(connection, close=True)
+            raise
+        except BaseException:
+            self.put_connection(connection)
+            raise
+        self.put_connection(connection)
+
+    def insert_matches(self, matches, **kwargs):
+        """Insert a batch of matches and their frags in one transaction
+
+        Arguments:
+            matches: (list) a list of dictionaries returned by parse_log_lines
+            kwargs: the options of the insert function, such as insert_method
+
+        Returns: a list of the identifiers of the matches
+        """
+        with self.connection() as connection:
+            return self.insert_matches_function(connection, matches, **kwargs)
+
+    def close(self):
+        """Close all the connections of the pool, if not closed yet"""
+        if not self.pool.closed:
+            self.pool.closeall()
+            with self._lock:
+                self._last_used_times.clear()
@@ -3,14 +3,22 @@
 import os
 import logging
 import datetime
+import array
+import atexit
 import csv
+import io
 import sqlite3
 import psycopg2
+import psycopg2.extras
 import constants as const
+import match_repository
 
 # Set logging
 logging.basicConfig(level=logging.INFO, filemode='w')
 
+# Number of seconds since the start of the hour of each "MM:SS" frag time
+__SECONDS_OF_HOUR = {'%02d:%02d' % divmod(seconds, 60): seconds for seconds in range(3600)}
+
 
 # Waypoint 1: Read Game Session Log File
 def read_log_file(log_file_pathname):
@@ -113,50 +121,68 @@ def parse_match_game_mode_and_map_name(log_data):
     return mode_map_name[::-1]
 
 
-def parse_frags(log_data):
+def parse_frags(log_data, log_start_time=None):
     """Return a list of frags of game
 
-    Arguments: log_data:(str) data of log file
+    Arguments:
+        log_data:(str) data of log file
+        log_start_time: (datetime.datetime object) the time the Far Cry engine
+            began to log events, parsed from log_data if None
 
     Returns: a list of frags of game
     """
-    # Find frags by seach as pattern in log_data
-    frags_list = const.FRAGS_PATTERN.findall(log_data)
+    return list(iter_frags(*parse_frag_offsets(log_data, log_start_time)))
 
-    # Reset start time at minute=0 and second=0
-    start_time = parse_log_start_time(log_data).replace(minute=0, second=0)
 
-    last_hour_frag = start_time.hour
+def parse_frag_offsets(log_data, log_start_time=None):
+    """Parse the frags of a log with their times as integer offsets, no
+    datetime object being created
 
-    # The first frag
-    first_frag_time = start_time + datetime.timedelta(hours=start_time.hour - last_hour_frag,
-                                                      minutes=int(frags_list[0][0][:2]),
-                                                      seconds=int(frags_list[0][0][-2:]))
+    Arguments:
+        log_data:(str) data of log file
+        log_start_time: (datetime.datetime object) the time the Far Cry engine
+            began to log events, parsed from log_data if None
+
+    Returns: a tuple (hour_start_time, frag_offsets, frag_players)
+        hour_start_time (datetime.datetime object): the log start time at
+            minute=0 and second=0
+        frag_offsets (array.array): the number of seconds from hour_start_time
+            to each frag
+        frag_players (list): tuples (killer_name[, victim_name, weapon_code])
+    """
+    if log_start_time is None:
+        log_start_time = parse_log_start_time(log_data)
+    hour_start_time = log_start_time.replace(minute=0, second=0)
 
-    # Initial a list of frag history
-    frag_history = [tuple([first_frag_time] + [val for val in frags_list[0][1:] if val != ''])]
+    frags_list = const.FRAG_LINE_PATTERN.findall(log_data)
 
-    for i in range(1, len(frags_list)):
+    # Frag times only have minutes and seconds, an hour is added each time
+    # the minutes go backwards
+    frag_offsets = array.array('l')
+    hour_offset = 0
+    last_seconds = 0
+    for seconds in map(__SECONDS_OF_HOUR.__getitem__, [frag[0] for frag in frags_list]):
+        if seconds < last_seconds and seconds // 60 < last_seconds // 60:
+            hour_offset += 3600
+        last_seconds = seconds
+        frag_offsets.append(hour_offset + seconds)
 
-        # Get the last minute and second of each frag
-        last_minute_frag = frags_list[i - 1][0].split(':')[0]
+    # A suicide has no victim nor weapon
+    frag_players = [tuple(filter(None, frag[1:])) for frag in frags_list]
 
-        # Get the current minute and second of each frag
-        cur_minute_frag = frags_list[i][0][:2]
-        cur_second_frag = frags_list[i][0][-2:]
+    return hour_start_time, frag_offsets, frag_players
 
-        # In case hour changed
-        if cur_minute_frag < last_minute_frag:
-            last_hour_frag -= 1
-        # Get the current match by hour, minute and second of the current frag
-        # plus start time
-        cur_frag = start_time + datetime.timedelta(hours=start_time.hour - last_hour_frag,
-                                                   minutes=int(cur_minute_frag),
-                                                   seconds=int(cur_second_frag))
-        # Add to frag history
-        frag_history.append(tuple([cur_frag] + [val for val in frags_list[i][1:] if val != '']))
 
-    return frag_history
+def iter_frags(hour_start_time, frag_offsets, frag_players):
+    """Create the frags parsed by parse_frag_offsets one by one, when they
+    are written
+
+    Arguments: the tuple returned by parse_frag_offsets
+
+    Returns: an iterator of frags (frag_time, killer_name[, victim_name, weapon_code])
+    """
+    for frag_offset, players in zip(frag_offsets, frag_players):
+        yield (hour_start_time + datetime.timedelta(seconds=frag_offset), *players)
 
 
 # Waypoint 7: Prettify Frag History
@@ -254,6 +280,161 @@ def parse_match_start_and_end_times(log_data, log_start_time, frags):
     return (session_start_object, session_end_object)
 
 
+def read_log_lines(log_file_pathname):
+    """Yield the lines of a log file one by one, without reading the whole file
+
+    Arguments: (str): pathname of a Far Cry server log file
+
+    Returns: an iterator of the lines of the file
+    """
+    # Data valid
+    if not isinstance(log_file_pathname, str):
+        logging.warning("The given path %s is not a string", log_file_pathname,
+                        exc_info=True)
+
+    log_file_path = os.path.expanduser(os.path.abspath(log_file_pathname))
+
+    with open(log_file_path) as log_file:
+        yield from log_file
+
+
+def iter_log_events(log_lines):
+    """Parse a log in a single pass, line by line, with a state machine
+
+    Arguments:
+        log_lines: an iterable of the lines of a log, such as read_log_lines
+
+    Returns: an iterator of tuples (event, value), as soon as they are known:
+        ('log_start_time', datetime.datetime object with time zone)
+        ('mode_and_map', (mode, map))
+        ('match_start', datetime.datetime object)
+        ('frag', (frag_time, killer_name[, victim_name, weapon_code]))
+        ('match_end', datetime.datetime object), once all the lines are read
+    """
+    naive_start_time = None
+    log_start_time = None
+    mode_and_map_found = False
+    match_start_found = False
+    end_time_string = None
+    error_end_time_string = None
+
+    # Frag times only have minutes and seconds, an hour is added each time
+    # the minutes go backwards
+    seconds_of_hour = __SECONDS_OF_HOUR
+    hour_start_time = None
+    hour_offset = 0
+    last_minute_frag = 0
+    last_frag_time = None
+
+    for line in log_lines:
+        # A cheap check of the line before running the regular expression
+        if naive_start_time is None:
+            if 'Log Started at' in line:
+                match = const.START_TIME_PATTERN.search(line)
+                naive_start_time = datetime.datetime.strptime(match.group(1),
+                                                              '%A, %B %d, %Y %X')
+            continue
+
+        if log_start_time is None:
+            if 'Lua cvar: (g_timezone' in line:
+                match = const.CONSOLE_VARIABLES_PATTERN.search(line)
+                if match and match.group(1).split(',')[0] == 'g_timezone':
+                    time_zone_info = datetime.timezone(datetime.timedelta(
+                        hours=int(match.group(1).split(',')[1])))
+                    log_start_time = naive_start_time.replace(tzinfo=time_zone_info)
+                    hour_start_time = log_start_time.replace(minute=0, second=0)
+                    yield 'log_start_time', log_start_time
+            continue
+
+        # Classify and parse each record of the line in a single match. The
+        # server sometimes writes a record over another one, on the same line:
+        # the rest of the line is searched for more records, so that the frags
+        # are found wherever they are, as in parse_frag_offsets
+        match = const.LOG_LINE_PATTERN.search(line)
+        while match is not None:
+            line_type = match.lastgroup
+
+            if line_type == 'frag':
+                seconds = seconds_of_hour[match.group('time')]
+                # In case hour changed
+                if seconds // 60 < last_minute_frag:
+                    hour_offset += 3600
+                last_minute_frag = seconds // 60
+                last_frag_time = hour_start_time + datetime.timedelta(seconds=hour_offset + seconds)
+                yield 'frag', tuple([last_frag_time] + [
+                    val for val in match.group('killer_name', 'victim_name', 'weapon_code')
+                    if val])
+
+            elif line_type == 'mode_and_map':
+                if not mode_and_map_found:
+                    mode_and_map_found = True
+                    yield 'mode_and_map', match.group('game_mode', 'map_name')
+
+            elif line_type == 'match_start':
+                if not match_start_found:
+                    match_start_found = True
+                    start_time_string = match.group('time')
+                    yield 'match_start', __conver_string_time_to_object(
+                        log_start_time.replace(minute=0, second=0),
+                        start_time_string[:2], start_time_string[-2:])
+
+            elif line_type == 'end_time':
+                if end_time_string is None:
+                    end_time_string = match.group('time')
+
+            elif error_end_time_string is None:
+                error_end_time_string = match.group('time')
+
+            match = const.LOG_LINE_PATTERN.search(line, match.end())
+
+    # In case engine crashed before the end of a game session
+    end_time_string = end_time_string or error_end_time_string
+    if end_time_string and last_frag_time:
+        yield 'match_end', __conver_string_time_to_object(
+            last_frag_time.replace(minute=0, second=0),
+            end_time_string[:2], end_time_string[-2:])
+
+
+def parse_log_lines(log_lines):
+    """Parse all the data of a match in a single pass over the lines of its log
+
+    Arguments:
+        log_lines: an iterable of the lines of a log, such as read_log_lines
+
+    Returns: a dictionary with the keys
+        log_start_time (datetime.datetime object),
+        game_mode (str), map_name (str),
+        start_time (datetime.datetime object), end_time (datetime.datetime object),
+        frags (list): a list of frags of game
+    """
+    match = {'log_start_time': None, 'game_mode': None, 'map_name': None,
+             'start_time': None, 'end_time': None, 'frags': []}
+
+    for event, value in iter_log_events(log_lines):
+        if event == 'frag':
+            match['frags'].append(value)
+        elif event == 'mode_and_map':
+            match['game_mode'], match['map_name'] = value
+        elif event == 'match_start':
+            match['start_time'] = value
+        elif event == 'match_end':
+            match['end_time'] = value
+        else:
+            match['log_start_time'] = value
+
+    return match
+
+
+def parse_log_file(log_file_pathname):
+    """Parse all the data of a match from a log file, read line by line
+
+    Arguments: (str): pathname of a Far Cry server log file
+
+    Returns: the dictionary returned by parse_log_lines
+    """
+    return parse_log_lines(read_log_lines(log_file_pathname))
+
+
 # Waypoint 9: Create Frag History CSV File
 def write_frag_csv_file(log_file_pathname, frags):
     """Write data to given csv file
@@ -279,7 +460,8 @@ def insert_match_to_sqlite(file_pathname,
                            end_time,
                            game_mode,
                            map_name,
-                           frags):
+                           frags,
+                           insert_method='executemany'):
     """Insert Game Session Data into SQLite
 
     Arguments:
@@ -303,6 +485,8 @@ def insert_match_to_sqlite(file_pathname,
                     who fragged another or killed himself;
                 victim_name (optional): (str) username of the player who has been fragged;
                 weapon_code (optional): (str) code of the weapon that was used to frag.
+
+        insert_method (str): one of SQLITE_INSERT_METHODS, see insert_frags_to_sqlite
     """
     # Data validation
     if not isinstance(file_pathname, str):
@@ -327,7 +511,7 @@ def insert_match_to_sqlite(file_pathname,
             # Execute a command: pass data
             cur.execute(const.SQLITE_MATCH, (start_time, end_time, game_mode, map_name))
             # execute each line
-            insert_frags_to_sqlite(conn, cur.lastrowid, frags)
+            insert_frags_to_sqlite(conn, cur.lastrowid, frags, insert_method)
             logging.info(cur.lastrowid)
     except sqlite3.IntegrityError:
         logging.error("Unable to connect")
@@ -341,7 +525,7 @@ def insert_match_to_sqlite(file_pathname,
 
 
 # Waypoint 26: Insert Match Frags into SQLite
-def insert_frags_to_sqlite(connection, match_id, frags):
+def insert_frags_to_sqlite(connection, match_id, frags, insert_method='executemany'):
     """Insert Match Frags (new record) into SQLite (the table match_frag)
 
     Arguments:
@@ -349,6 +533,8 @@ def insert_frags_to_sqlite(connection, match_id, frags):
         match_id: (int) the identifier of a match
         frags: (list) a list of frags, as passed to the function insert_match_to_sqlite,
             that occurred during this match
+        insert_method: (str) 'executemany' to insert all the frags with one
+            statement, or 'execute' to insert them one by one
     """
     # Data validation
     if not isinstance(connection, sqlite3.Connection):
@@ -361,6 +547,11 @@ def insert_frags_to_sqlite(connection, match_id, frags):
     # Open a cursor to perform database operations
     cur = connection.cursor()
 
+    if insert_method == 'executemany':
+        # One statement for all the frags, in the transaction of the match
+        cur.executemany(const.SQLITE_KILL_OTHER, __get_frag_rows(match_id, frags))
+        return
+
     for frag in frags:
         # in case kill others by weapon
         if len(frag) != 2:
@@ -370,13 +561,29 @@ def insert_frags_to_sqlite(connection, match_id, frags):
             cur.execute(const.SQLITE_KILL_ITSELF, (match_id, *frag))
 
 
+def __get_frag_rows(match_id, frags):
+    """Get the rows of the table match_frag of the frags of a match
+
+    Arguments:
+        match_id: the identifier of a match
+        frags: (list) a list of frags that occurred during this match
+
+    Returns: an iterator of tuples (match_id, frag_time, killer_name,
+        victim_name, weapon_code), victim_name and weapon_code being None
+        in case kill itself
+    """
+    for frag in frags:
+        yield (match_id, *frag) if len(frag) != 2 else (match_id, *frag, None, None)
+
+
 # Waypoint 48: Insert Game Session Data to PostgreSQL Database
 def insert_match_to_postgresql(properties,
                                start_time,
                                end_time,
                                game_mode,
                                map_name,
-                               frags):
+                               frags,
+                               insert_method='execute_values'):
     """ Insert Game Session Data to PostgreSQL Database
 
     Arguments:
@@ -404,6 +611,9 @@ def insert_match_to_postgresql(properties,
                 who fragged another or killed himself;
             victim_name (optional): (str) username of the player who has been fragged;
             weapon_code (optional): (str) code of the weapon that was used to frag.
+
+        @param insert_method (str): one of POSTGRES_INSERT_METHODS, see
+            insert_frags_to_postgresql
     """
 
     # Data validation
@@ -418,40 +628,123 @@ def insert_match_to_postgresql(properties,
     if not isinstance(frags, list):
         logging.error("Data type is inappropriate")
 
+    id_of_new_row = None
     try:
-        # connect to the PostgreeSQL server
-        conn = psycopg2.connect(
-            host=properties[0], user=properties[2],
-            password=properties[3], dbname=properties[1])
-        # create a cursor
-        cur = conn.cursor()
-        # pass data to match table
-        cur.execute(const.POSTGRES_MATCH,
-                    (start_time, end_time, game_mode, map_name))
-        # Get UUID as match_id
-        id_of_new_row = cur.fetchone()[0]
+        # The connections to the server are reused from match to match
+        repository = get_postgresql_repository(properties)
+        # pass data to match and match_frag tables, get UUID as match_id
+        id_of_new_row = repository.insert_matches(
+            [{'start_time': start_time, 'end_time': end_time, 'game_mode': game_mode,
+              'map_name': map_name, 'frags': frags}],
+            insert_method=insert_method)[0]
         logging.info("match_id: %s", id_of_new_row)
-
-        # pass data to match_frag table
-        for frag in frags:
-            if len(frag) != 2:
-                cur.execute(const.POSTGRES_KILL_OTHER, (id_of_new_row, *frag))
-            else:
-                cur.execute(const.POSTGRES_KILL_ITSELF, (id_of_new_row, *frag))
-        conn.commit()
     except (psycopg2.Error) as error:
         logging.error('Unable to connect %s', error)
-    finally:
-        # Closing database connection
-        if conn:
-            # Close the communicateion with the PostGreSQL
-            cur.close()
-            conn.close()
-            logging.info("PostgreSQL connection is closed")
 
     return id_of_new_row
 
 
+# Repositories of the PostgreSQL databases, by connection properties
+__postgresql_repositories = {}
+
+
+def get_postgresql_repository(properties, pool_size=match_repository.POOL_SIZE):
+    """Get the repository of a PostgreSQL database, shared by the insert
+    functions, creating its pool of connections the first time
+
+    Arguments:
+        properties: (tuple) form: (hostname, database_name, username, password)
+        pool_size: (int) the maximum number of open connections
+
+    Returns: a match_repository.MatchRepository
+    """
+    properties = tuple(properties)
+    repository = __postgresql_repositories.get(properties)
+    if repository is None:
+        repository = __postgresql_repositories[properties] = \
+            match_repository.MatchRepository.postgresql(
+                properties, insert_matches_to_postgresql, pool_size)
+        atexit.register(repository.close)
+    return repository
+
+
+def insert_frags_to_postgresql(cursor, match_id, frags, insert_method='execute_values'):
+    """Insert Match Frags into PostgreSQL (the table match_frag)
+
+    Arguments:
+        cursor: (psycopg2 cursor) a cursor of an open connection
+        match_id: the identifier of a match
+        frags: (list) a list of frags that occurred during this match
+        insert_method: (str) 'execute_values' to insert the frags with
+            multi-row statements, 'copy' to stream them with COPY FROM STDIN,
+            or 'execute' to insert them one by one
+    """
+    if insert_method == 'execute_values':
+        psycopg2.extras.execute_values(cursor, const.POSTGRES_FRAGS_VALUES,
+                                       __get_frag_rows(match_id, frags), page_size=1000)
+        return
+
+    if insert_method == 'copy':
+        # CSV rows, an empty unquoted field being NULL
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            (match_id, frag_time.isoformat(), *names)
+            for (_, frag_time, *names) in __get_frag_rows(match_id, frags))
+        buffer.seek(0)
+        cursor.copy_expert(const.POSTGRES_COPY_FRAGS, buffer)
+        return
+
+    for frag in frags:
+        if len(frag) != 2:
+            cursor.execute(const.POSTGRES_KILL_OTHER, (match_id, *frag))
+        else:
+            cursor.execute(const.POSTGRES_KILL_ITSELF, (match_id, *frag))
+
+
+def insert_matches_to_sqlite(connection, matches, insert_method='executemany'):
+    """Insert a batch of matches and their frags into SQLite in one transaction
+
+    Arguments:
+        connection: (sqlite3 object) a sqlite3 Connection object
+        matches: (list) a list of dictionaries returned by parse_log_lines
+        insert_method: (str) one of SQLITE_INSERT_METHODS
+
+    Returns: a list of the identifiers of the matches
+    """
+    match_ids = []
+    # Commit once for the whole batch, or roll it back
+    with connection:
+        cur = connection.cursor()
+        for match in matches:
+            cur.execute(const.SQLITE_MATCH, (match['start_time'], match['end_time'],
+                                             match['game_mode'], match['map_name']))
+            insert_frags_to_sqlite(connection, cur.lastrowid, match['frags'], insert_method)
+            match_ids.append(cur.lastrowid)
+    return match_ids
+
+
+def insert_matches_to_postgresql(connection, matches, insert_method='execute_values'):
+    """Insert a batch of matches and their frags into PostgreSQL in one transaction
+
+    Arguments:
+        connection: (psycopg2 connection) an open connection
+        matches: (list) a list of dictionaries returned by parse_log_lines
+        insert_method: (str) one of POSTGRES_INSERT_METHODS
+
+    Returns: a list of the identifiers of the matches
+    """
+    match_ids = []
+    # Commit once for the whole batch, or roll it back
+    with connection:
+        with connection.cursor() as cur:
+            for match in matches:
+                cur.execute(const.POSTGRES_MATCH, (match['start_time'], match['end_time'],
+                                                   match['game_mode'], match['map_name']))
+                match_ids.append(cur.fetchone()[0])
+                insert_frags_to_postgresql(cur, match_ids[-1], match['frags'], insert_method)
+    return match_ids
+
+
 # Waypoint 53: Determine Serial Killers
 def calculate_serial_killers(frags):
     """Determine Serial Killers:
@@ -464,7 +757,7 @@ def calculate_serial_killers(frags):
     Returns:
         (dict): a dictionary of killers with their longest kill series
     """
-    return __calculate_serial_killers_losers(frags, is_serial_killer=True)
+    return calculate_serial_killers_and_losers(frags)[0]
 
 
 # Waypoint 54: Determine Serial Losers
@@ -479,7 +772,7 @@ def calculate_serial_losers(frags):
     Returns:
         (dict): a dictionary of losers with their longest series
     """
-    return __calculate_serial_killers_losers(frags, is_serial_killer=False)
+    return calculate_serial_killers_and_losers(frags)[1]
 
 
 def __remove_player_from_frag(original_tuple, element_to_remove):
@@ -499,113 +792,119 @@ def __remove_player_from_frag(original_tuple, element_to_remove):
     return tuple(new_tuple)
 
 
-def __calculate_serial_killers_losers(frags, is_serial_killer=False):
-    """Determine Serial Killers or Losers
+def __end_series(longest_series, player, series, at_end_of_match):
+    """Keep the series of a player which has just ended if it is one of
+    his longest
+
+    Arguments:
+        longest_series (dict): for each player, a list [length, ranges]
+            of the length of his longest series and of the (start, end)
+            indexes in the frags of each series of this length
+        player (str): name of the player
+        series (list): [start, end, length] of the series which has ended
+        at_end_of_match (bool): a series of one frag only counts if it
+            lasts until the end of the match
+    """
+    start, end, length = series
+    if length == 1 and not at_end_of_match:
+        return
+    longest = longest_series.get(player)
+    if longest is None or longest[0] < length:
+        longest_series[player] = [length, [(start, end)]]
+    elif longest[0] == length:
+        longest[1].append((start, end))
+
+
+def calculate_serial_killers_and_losers(frags):
+    """Determine Serial Killers and Losers in a single pass over the frags
+
+    Only the start and end indexes and the length of the current series of
+    each player are kept while going through the frags, the frags of the
+    longest series are collected at the end.
 
     Arguments:
         frags (list): a list of frags of game
 
-    Keyword Arguments:
-        is_serial_killer {bool}: (default: {False})
-            True: calculate serial killer
-            False: calculate serial looser
-
-    Returns: (dict)
-        is_serial_killer is True: a dictionary of killers with their longest kill series
-        is_serial_killer is False: a dictionary of killers with their longest loose series
-            where the key corresponds to the name of a player and the value
-            corresponds to a list of frag times which contain
-            the player's longest series.
-            (frag_time, frag_time, victim_name, weapon_code)
+    Returns: a tuple (serial_killers, serial_losers) of dictionaries where
+        the key corresponds to the name of a player and the value to the
+        list of the frags of the player's longest series, without his name:
+        (frag_time, victim_name, weapon_code) for a kill series,
+        (frag_time, killer_name, weapon_code) or (frag_time,) when the player
+        killed himself, for a loose series. Several series of the same
+        length follow each other.
     """
-
     if not isinstance(frags, list):
         logging.error("Data type is inappropriate")
 
-    # An dictionary to store all serial killers/losers temporary
-    serial_players_temp = {}
-    # Final dict to store killers with their longest killers/losers series
-    serial_killers_or_losers = {}
-    # key is killer, val is the current longest serial count
-    longest_serial = {}
-
-    # Define current killer and current victim of each frag
-    for frag in frags:
-        player1 = frag[1]
-        player2 = frag[2] if len(frag) != 2 else frag[1]
-
-        if is_serial_killer:  # To calculate serial killer
-            cur_killer, cur_victim = player1, player2
-            # Add current killer and his frag to serial_players_temp
-            if cur_killer != cur_victim:  # eleminate kill itself cases
-                if cur_killer not in serial_players_temp:
-                    serial_players_temp[cur_killer] = [frag]
-                else:
-                    serial_players_temp[cur_killer].append(frag)
-        else:  # To calculate serial looser
-            cur_killer, cur_victim = player2, player1
-            if cur_killer not in serial_players_temp:
-                serial_players_temp[cur_killer] = [frag]
+    # key is a player, value is [start, end, length] of his current series
+    kill_series = {}
+    death_series = {}
+    # key is a player, value is [length, ranges] of his longest series
+    longest_kill_series = {}
+    longest_death_series = {}
+
+    for index, frag in enumerate(frags):
+        killer = frag[1]
+        victim = frag[2] if len(frag) != 2 else killer
+
+        # A kill of another player extends the kill series of the killer
+        if killer != victim:
+            series = kill_series.get(killer)
+            if series is None:
+                kill_series[killer] = [index, index, 1]
             else:
-                serial_players_temp[cur_killer].append(frag)
-
-        # when the player is killed
-        if cur_victim in serial_players_temp:
-            frag_of_current_vict = serial_players_temp[cur_victim]
-            # Remove name of frags
-            frag_of_current_vict = tuple([__remove_player_from_frag(frag, cur_victim)
-                                          for frag in frag_of_current_vict])
-            # only if the number of frags of the player is larger than 1
-            # considers as Kill series
-            if len(frag_of_current_vict) != 1:
-                # player has not existed in result dict (the first serial kill list)
-                # -> 1. add all consecutive frags of the player to result dict
-                # -> 2. Update longest_serial dict
-                if cur_victim not in serial_killers_or_losers:
-                    serial_killers_or_losers[cur_victim] = frag_of_current_vict
-                    longest_serial[cur_victim] = len(frag_of_current_vict)
-
-                # player existed in result dict
-                # --> 1. Compare the number of victim of the player of temporary
-                #     to the current longest serial count
-                # -> 2. Update longest_serial dict
-                else:
-                    if longest_serial[cur_victim] == len(frag_of_current_vict):
-                        serial_killers_or_losers[cur_victim] += frag_of_current_vict
-                    elif longest_serial[cur_victim] < len(frag_of_current_vict):
-                        serial_killers_or_losers[cur_victim] = frag_of_current_vict
-                        longest_serial[cur_victim] = len(frag_of_current_vict)
-
-            # remove current player from temp dict
-            del serial_players_temp[cur_victim]
-
-    # In case player still alive till the end of match
-    for (killer, frag_of_killer) in serial_players_temp.items():
-        if killer not in longest_serial:
-            longest_serial[killer] = 0
-        if len(frag_of_killer) == longest_serial[killer]:
-            serial_killers_or_losers[killer] += serial_players_temp[killer]
-        elif len(frag_of_killer) > longest_serial[killer]:
-            serial_killers_or_losers[killer] = serial_players_temp[killer]
-            longest_serial[killer] = len(frag_of_killer)
-
-    logging.info("The killer's longest series: %s", longest_serial)
-
-    return serial_killers_or_losers
+                series[1] = index
+                series[2] += 1
+        # which ends when he is killed, by another player or by himself
+        series = kill_series.pop(victim, None)
+        if series is not None:
+            __end_series(longest_kill_series, victim, series, False)
+
+        # A death, or a suicide, extends the loose series of the victim
+        series = death_series.get(victim)
+        if series is None:
+            death_series[victim] = [index, index, 1]
+        else:
+            series[1] = index
+            series[2] += 1
+        # which ends when he kills, another player or himself
+        series = death_series.pop(killer, None)
+        if series is not None:
+            __end_series(longest_death_series, killer, series, False)
+
+    # In case player still alive till the end of match, by start of series
+    for player, series in kill_series.items():
+        __end_series(longest_kill_series, player, series, True)
+    for player, series in death_series.items():
+        __end_series(longest_death_series, player, series, True)
+
+    logging.info("The killer's longest series: %s",
+                 {player: longest[0] for player, longest in longest_kill_series.items()})
+
+    serial_killers = {
+        player: [__remove_player_from_frag(frag, player)
+                 for start, end in ranges for frag in frags[start:end + 1]
+                 if frag[1] == player and len(frag) != 2 and frag[2] != player]
+        for player, (_, ranges) in longest_kill_series.items()}
+    serial_losers = {
+        player: [__remove_player_from_frag(frag, player)
+                 for start, end in ranges for frag in frags[start:end + 1]
+                 if frag[-1 if len(frag) == 2 else 2] == player]
+        for player, (_, ranges) in longest_death_series.items()}
+    return serial_killers, serial_losers
 
 
 def main():
     """Demonstrate and run test"""
 
-    log_data = read_log_file('./logs/log08.txt')
-    log_start_time = parse_log_start_time(log_data)
-    frags = parse_frags(log_data)
+    # Parse the log in a single pass, line by line
+    match = parse_log_file('./logs/log08.txt')
+    frags = match['frags']
 
     # TEST FOR WAYPOINT 48
-    game_mode, map_name = parse_match_game_mode_and_map_name(log_data)
-    start_time, end_time = parse_match_start_and_end_times(log_data, log_start_time, frags)
     properties = ('localhost', 'farcry', 'postgres', None)
-    insert_match_to_postgresql(properties, start_time, end_time, game_mode, map_name, frags)
+    insert_match_to_postgresql(properties, match['start_time'], match['end_time'],
+                               match['game_mode'], match['map_name'], frags)
 
     # # TEST FOR WAYPOINT 54
     # serial_losers = calculate_serial_losers(frags)